@@ -1,71 +1,37 @@
-import bpy
+import os
+
+import numpy
 
-from . import pyjet
-from .utils import print_info
+import bpy
 
 
-solvers = {
-    'APIC': pyjet.ApicSolver3,
-    'PIC': pyjet.PicSolver3,
-    'FLIP': pyjet.FlipSolver3
-}
-advection_solvers = {
-    'SEMI_LAGRANGIAN': pyjet.SemiLagrangian3,
-    'CUBIC_SEMI_LAGRANGIAN': pyjet.CubicSemiLagrangian3
-}
-diffusion_solvers = {
-    'FORWARD_EULER': pyjet.GridForwardEulerDiffusionSolver3,
-    'BACKWARD_EULER': pyjet.GridBackwardEulerDiffusionSolver3
-}
-pressure_solvers = {
-    'FRACTIONAL_SINGLE_PHASE': pyjet.GridFractionalSinglePhasePressureSolver3,
-    'SINGLE_PHASE': pyjet.GridSinglePhasePressureSolver3
-}
+def get_cache_folder(jet):
+    # frame paths are the folder joined with the file name,
+    # the other cache files are joined with os.path.join
+    return os.path.join(bpy.path.abspath(jet.cache_folder), '')
 
 
-def get_triangle_mesh(context, source, solver, domain_object):
-    selected_objects_name = [o.name for o in context.selected_objects]
-    active_object_name = context.object.name
-    bpy.ops.object.select_all(action='DESELECT')
-    source.select_set(True)
-    bpy.ops.object.duplicate()
-    bpy.ops.object.transform_apply(location=False, rotation=False, scale=True)
-    obj = context.selected_objects[0]
-    mesh = obj.data
-    view_layer = bpy.context.view_layer
-    view_layer.objects.active = obj
-    bpy.ops.object.convert(target='MESH')
-    bpy.ops.object.mode_set(mode='EDIT')
-    bpy.ops.mesh.reveal()
-    bpy.ops.mesh.select_all(action='SELECT')
-    bpy.ops.mesh.quads_convert_to_tris(quad_method='BEAUTY', ngon_method='BEAUTY')
-    bpy.ops.object.mode_set(mode='OBJECT')
-    print_info('            Generete triangle mesh start: "{0}"'.format(source.name))
-    triangle_mesh = pyjet.TriangleMesh3(
-        points=[[v.co.x, v.co.z, v.co.y] for v in mesh.vertices],
-        pointIndices=[[p.vertices[0], p.vertices[2], p.vertices[1]] for p in mesh.polygons]
-    )
-    print_info('            Generete triangle mesh end:   "{0}"'.format(source.name))
-    print_info('            Generete implicit triangle mesh start: "{0}"'.format(source.name))
-    imp_triangle_mesh = pyjet.ImplicitTriangleMesh3(
-        mesh=triangle_mesh,
-        resolutionX=int(round(
-            solver.resolution.x * obj.dimensions[0] / domain_object.dimensions[0],
-            0
-        )),
-        margin=0.2
-    )
-    print_info('            Generete implicit triangle mesh end:   "{0}"'.format(source.name))
-    bpy.data.objects.remove(obj)
-    bpy.data.meshes.remove(mesh)
-    for obj_name in selected_objects_name:
-        bpy.data.objects[obj_name].select_set(True)
-    view_layer = bpy.context.view_layer
-    view_layer.objects.active = bpy.data.objects[active_object_name]
-    return imp_triangle_mesh
+def get_mesh_arrays(context, source):
+    # evaluated geometry of the object (modifiers, shape keys) with applied
+    # scale, returns the points and the triangles arrays, the scene is
+    # not changed
+    depsgraph = context.evaluated_depsgraph_get()
+    obj = source.evaluated_get(depsgraph)
+    mesh = obj.to_mesh()
+    try:
+        mesh.calc_loop_triangles()
+        points = numpy.empty(len(mesh.vertices) * 3, dtype=numpy.float32)
+        mesh.vertices.foreach_get('co', points)
+        triangles = numpy.empty(len(mesh.loop_triangles) * 3, dtype=numpy.int32)
+        mesh.loop_triangles.foreach_get('vertices', triangles)
+    finally:
+        obj.to_mesh_clear()
+    points = points.reshape(-1, 3)
+    points *= numpy.array(obj.scale, dtype=numpy.float32)
+    return points, triangles.reshape(-1, 3)
 
 
-def set_closed_domain_boundary_flag(obj, flag_type):
+def get_boundary(obj, flag_type):
     jet = obj.jet_fluid
     if flag_type == 'domain_closed_boundary':
         bounds = [
@@ -95,50 +61,21 @@ def set_closed_domain_boundary_flag(obj, flag_type):
             jet.close_down
         ]
     else:
-        raise 'Unsupported flag type'
-    flags = [
-        pyjet.DIRECTION_RIGHT,
-        pyjet.DIRECTION_LEFT,
-        pyjet.DIRECTION_FRONT,
-        pyjet.DIRECTION_BACK,
-        pyjet.DIRECTION_UP,
-        pyjet.DIRECTION_DOWN
-    ]
+        raise ValueError('Unsupported flag type: {}'.format(flag_type))
+    return bounds
 
-    bound_flag = 0
-    for bound_index, bound in enumerate(bounds):
-        if bound:
-            bound_flag |= flags[bound_index]
 
-    return bound_flag
-
-
-def calc_res(self, obj, type='FLUID'):
-    self.domain = obj
-    domain_size_x = obj.bound_box[6][0] * obj.scale[0] - obj.bound_box[0][0] * obj.scale[0]
-    domain_size_y = obj.bound_box[6][1] * obj.scale[1] - obj.bound_box[0][1] * obj.scale[1]
-    domain_size_z = obj.bound_box[6][2] * obj.scale[2] - obj.bound_box[0][2] * obj.scale[2]
-    domain_sizes = [
-        domain_size_x,
-        domain_size_y,
-        domain_size_z
+def get_domain(obj):
+    origin = [
+        obj.bound_box[0][i] * obj.scale[i] + obj.location[i]
+        for i in range(3)
+    ]
+    size = [
+        obj.bound_box[6][i] * obj.scale[i] - obj.bound_box[0][i] * obj.scale[i]
+        for i in range(3)
     ]
-    self.domain_size_x = domain_size_x
-    if type == 'FLUID':
-        resolution = obj.jet_fluid.resolution
-        grid_spacing = (0, 0, 0)
-    elif type == 'MESH':
-        resolution = obj.jet_fluid.resolution_mesh
-        fluid_res = obj.jet_fluid.resolution
-        grid_spacing_x = resolution
-        grid_spacing_y = resolution
-        grid_spacing_z = resolution
-        grid_spacing = (grid_spacing_x, grid_spacing_z, grid_spacing_y)
-    self.domain_max_size = max(domain_sizes)
-    resolution_x = int(round((domain_size_x / self.domain_max_size) * resolution, 1))
-    resolution_y = int(round((domain_size_y / self.domain_max_size) * resolution, 1))
-    resolution_z = int(round((domain_size_z / self.domain_max_size) * resolution, 1))
-    origin_x = obj.bound_box[0][0] * obj.scale[0] + obj.location[0]
-    origin_y = obj.bound_box[0][1] * obj.scale[1] + obj.location[1]
-    origin_z = obj.bound_box[0][2] * obj.scale[2] + obj.location[2]
-    return resolution_x, resolution_y, resolution_z, origin_x, origin_y, origin_z, domain_size_x, grid_spacing
+    return {
+        'origin': origin,
+        'size': size,
+        'location': list(obj.location)
+    }
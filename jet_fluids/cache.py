@@ -0,0 +1,481 @@
+import os
+import lzma
+import time
+import zlib
+import queue
+import struct
+import threading
+import collections
+
+import numpy
+
+
+# frame file layout (little-endian):
+#     header: magic, version, channels count, axes, particles count, origin
+#     channels table: one entry per channel
+#     channels data: blocks at the offsets from the channels table
+# quantized blocks start with the minimum and the step (3 doubles each),
+# delta blocks start with the step and the name of the reference frame file,
+# compressed blocks are compressed together with these parameters
+MAGIC = b'JETC'
+VERSION = 1
+HEADER = struct.Struct('<4sHH3sxQ3d')
+CHANNEL = struct.Struct('<8s4sBBBxIQQ')
+QUANTIZATION = struct.Struct('<3d3d')
+DELTA = struct.Struct('<3dH')
+
+ENCODING_RAW = 0
+ENCODING_QUANTIZED = 1
+ENCODING_DELTA = 2
+
+COMPRESSION_NONE = 0
+COMPRESSION_ZLIB = 1
+COMPRESSION_LZMA = 2
+compressions = {
+    'NONE': COMPRESSION_NONE,
+    'ZLIB': COMPRESSION_ZLIB,
+    'LZMA': COMPRESSION_LZMA
+}
+# decoded positions of the last frames, the references of delta frames
+DECODED_COUNT = 4
+decoded = collections.OrderedDict()
+decoded_lock = threading.Lock()
+
+
+class CacheWriteError(Exception):
+    pass
+
+
+Header = collections.namedtuple(
+    'Header',
+    ('version', 'axes', 'count', 'origin', 'channels')
+)
+Quantized = collections.namedtuple('Quantized', ('data', 'minimum', 'step'))
+Delta = collections.namedtuple('Delta', ('data', 'step', 'reference'))
+Channel = collections.namedtuple(
+    'Channel',
+    (
+        'name',
+        'dtype',
+        'components',
+        'encoding',
+        'compression',
+        'stride',
+        'offset',
+        'size'
+    )
+)
+
+
+def get_frame_path(folder, base_name, frame):
+    return '{0}{1}_{2:0>6}.bin'.format(folder, base_name, frame)
+
+
+def convert_array(array, data_type, swap=True, offset=None):
+    array = numpy.asarray(array)
+    if not swap and offset is None:
+        return numpy.ascontiguousarray(array, data_type)
+    # swap and offset on strided column views
+    array = array.reshape(-1, 3)
+    if swap:
+        axes_order = (0, 2, 1)
+    else:
+        axes_order = (0, 1, 2)
+    np_array = numpy.empty(array.shape, data_type)
+    for axis, source_axis in enumerate(axes_order):
+        if offset is None:
+            np_array[:, axis] = array[:, source_axis]
+        else:
+            numpy.subtract(
+                array[:, source_axis],
+                offset[axis],
+                out=np_array[:, axis],
+                casting='unsafe'
+            )
+    return np_array
+
+
+def quantize_array(array, bounds_min, bounds_max, tolerance):
+    # fixed point values relative to the bounds, the step is chosen so that
+    # the error does not exceed the tolerance
+    bounds_min = numpy.array(bounds_min, numpy.float64)
+    extent = numpy.array(bounds_max, numpy.float64) - bounds_min
+    levels = int(numpy.ceil(extent.max() / (2.0 * tolerance))) + 1
+    if levels <= numpy.iinfo(numpy.uint16).max:
+        data_type = numpy.uint16
+    elif levels <= numpy.iinfo(numpy.uint32).max:
+        data_type = numpy.uint32
+    else:
+        return numpy.asarray(array, numpy.float32)
+    step = numpy.maximum(extent / (levels - 1), tolerance)
+    values = numpy.subtract(array, bounds_min, dtype=numpy.float64)
+    values /= step
+    numpy.rint(values, out=values)
+    numpy.clip(values, 0, levels - 1, out=values)
+    return Quantized(values.astype(data_type), tuple(bounds_min), tuple(step))
+
+
+def dequantize(data, minimum, step):
+    values = numpy.empty(data.shape, numpy.float32)
+    numpy.multiply(data, step, out=values, casting='unsafe')
+    values += minimum
+    return values
+
+
+def apply_delta(previous, data, step):
+    values = numpy.empty(data.shape, numpy.float32)
+    numpy.multiply(data, step, out=values, casting='unsafe')
+    values += previous
+    return values
+
+
+class DeltaEncoder:
+    # stores the difference from the previous frame, the previous frame
+    # is taken as the reader decodes it, so that errors do not accumulate
+    def __init__(self, bounds_min, bounds_max, tolerance, keyframe_interval):
+        self.bounds_min = bounds_min
+        self.bounds_max = bounds_max
+        self.tolerance = tolerance
+        self.keyframe_interval = keyframe_interval
+        self.previous = None
+        self.reference = None
+        self.frames_count = 0
+
+    def encode(self, positions, file_path):
+        result = None
+        use_delta = (
+            self.previous is not None and
+            self.frames_count < self.keyframe_interval and
+            len(self.previous) == len(positions)
+        )
+        if use_delta:
+            step = 2.0 * self.tolerance
+            delta = numpy.subtract(positions, self.previous, dtype=numpy.float64)
+            delta /= step
+            numpy.rint(delta, out=delta)
+            # otherwise particles moved too far or were reordered,
+            # the frame is quantized as a keyframe
+            if not len(delta) or numpy.abs(delta).max() <= numpy.iinfo(numpy.int16).max:
+                data = delta.astype(numpy.int16)
+                result = Delta(data, (step, step, step), self.reference)
+                self.previous = apply_delta(self.previous, data, result.step)
+                self.frames_count += 1
+        if result is None:
+            result = quantize_array(
+                positions,
+                self.bounds_min,
+                self.bounds_max,
+                self.tolerance
+            )
+            if isinstance(result, Quantized):
+                self.previous = dequantize(result.data, result.minimum, result.step)
+            else:
+                self.previous = result
+            self.frames_count = 1
+        self.reference = os.path.basename(file_path)
+        return result
+
+
+def compress(data, compression):
+    if compression == COMPRESSION_ZLIB:
+        return zlib.compress(data, 6)
+    elif compression == COMPRESSION_LZMA:
+        return lzma.compress(data, preset=1)
+    return data
+
+
+def decompress(data, compression):
+    if compression == COMPRESSION_ZLIB:
+        return zlib.decompress(data)
+    elif compression == COMPRESSION_LZMA:
+        return lzma.decompress(data)
+    return data
+
+
+def write_frame(file_path, channels, origin=(0.0, 0.0, 0.0), axes='XYZ', compression='NONE'):
+    compression = compressions[compression]
+    arrays = []
+    count = None
+    for name, array in channels:
+        if isinstance(array, Quantized):
+            params = QUANTIZATION.pack(*array.minimum, *array.step)
+            encoding = ENCODING_QUANTIZED
+            array = array.data
+        elif isinstance(array, Delta):
+            reference = array.reference.encode()
+            params = DELTA.pack(*array.step, len(reference)) + reference
+            encoding = ENCODING_DELTA
+            array = array.data
+        else:
+            params = b''
+            encoding = ENCODING_RAW
+        array = numpy.asarray(array)
+        if array.ndim == 1:
+            array = array.reshape(-1, 1)
+        if count is None:
+            count = array.shape[0]
+        elif count != array.shape[0]:
+            raise ValueError('Channel "{}" has wrong elements count'.format(name))
+        array = numpy.ascontiguousarray(array, array.dtype.newbyteorder('<'))
+        if params or compression != COMPRESSION_NONE:
+            # encoded channels are written as a single block of bytes
+            data = compress(params + array.tobytes(), compression)
+        else:
+            data = array
+        arrays.append((name, array, encoding, data))
+    if count is None:
+        count = 0
+
+    offset = HEADER.size + CHANNEL.size * len(arrays)
+    table = []
+    for name, array, encoding, data in arrays:
+        size = data.nbytes if isinstance(data, numpy.ndarray) else len(data)
+        table.append(Channel(
+            name=name,
+            dtype=array.dtype.str,
+            components=array.shape[1],
+            encoding=encoding,
+            compression=compression,
+            stride=array.dtype.itemsize * array.shape[1],
+            offset=offset,
+            size=size
+        ))
+        offset += size
+
+    # write to a temporary file first, so that readers never see
+    # a partially written frame
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        header = HEADER.pack(
+            MAGIC,
+            VERSION,
+            len(table),
+            axes.encode(),
+            count,
+            *origin
+        )
+        checksum = zlib.crc32(header)
+        file.write(header)
+        for channel in table:
+            data = CHANNEL.pack(
+                channel.name.encode(),
+                channel.dtype.encode(),
+                channel.components,
+                channel.encoding,
+                channel.compression,
+                channel.stride,
+                channel.offset,
+                channel.size
+            )
+            checksum = zlib.crc32(data, checksum)
+            file.write(data)
+        for _, _, _, data in arrays:
+            checksum = zlib.crc32(data, checksum)
+            if isinstance(data, numpy.ndarray):
+                data.tofile(file)
+            else:
+                file.write(data)
+    os.replace(temp_path, file_path)
+    return {
+        'size': offset,
+        'checksum': '{:08x}'.format(checksum),
+        'channels': [channel.name for channel in table]
+    }
+
+
+class FrameWriter:
+    # writes frames in a background thread, the queue size limits
+    # the count of frames held in memory
+    def __init__(self, queue_size=2):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.error = None
+        self.frames_count = 0
+        self.write_time = 0.0
+        self.wait_time = 0.0
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def write(self, file_path, channels, callback=None, **kwargs):
+        # callback(info) is called in the writer thread, after the frame is written
+        self.put((file_path, write_frame, (file_path, channels), kwargs, callback))
+
+    def call(self, file_path, function, *args):
+        # other files, written in order with the frames,
+        # they are not counted in the frames statistics
+        self.put((file_path, function, args, {}, None))
+
+    def put(self, job):
+        self.check()
+        start_time = time.perf_counter()
+        self.queue.put(job)
+        self.wait_time += time.perf_counter() - start_time
+
+    def run(self):
+        while True:
+            job = self.queue.get()
+            if job is None:
+                break
+            if self.error is not None:
+                continue
+            file_path, function, args, kwargs, callback = job
+            start_time = time.perf_counter()
+            try:
+                info = function(*args, **kwargs)
+                if function is write_frame:
+                    info['write_time'] = time.perf_counter() - start_time
+                if callback:
+                    callback(info)
+            except Exception as error:
+                self.error = CacheWriteError(
+                    'Can\'t write "{0}": {1}'.format(file_path, error)
+                )
+                continue
+            if function is write_frame:
+                self.write_time += time.perf_counter() - start_time
+                self.frames_count += 1
+
+    def check(self):
+        if self.error is not None:
+            raise self.error
+
+    def close(self):
+        if self.thread.is_alive():
+            start_time = time.perf_counter()
+            self.queue.put(None)
+            self.thread.join()
+            self.wait_time += time.perf_counter() - start_time
+
+
+def read_header(file):
+    data = file.read(HEADER.size)
+    if len(data) != HEADER.size:
+        raise ValueError('Invalid cache file: "{}"'.format(file.name))
+    magic, version, channels_count, axes, count, *origin = HEADER.unpack(data)
+    if magic != MAGIC:
+        raise ValueError('Invalid cache file: "{}"'.format(file.name))
+    if version != VERSION:
+        raise ValueError('Unsupported cache file version: {}'.format(version))
+    channels = collections.OrderedDict()
+    for _ in range(channels_count):
+        name, dtype, *values = CHANNEL.unpack(file.read(CHANNEL.size))
+        name = name.rstrip(b'\0').decode()
+        dtype = dtype.rstrip(b'\0').decode()
+        channels[name] = Channel(name, dtype, *values)
+    return Header(version, axes.decode(), count, tuple(origin), channels)
+
+
+def get_header(file_path):
+    if not os.path.exists(file_path):
+        return
+    with open(file_path, 'rb') as file:
+        return read_header(file)
+
+
+def map_array(file_path, dtype, components, offset=0, count=None):
+    if count is None:
+        count = (os.path.getsize(file_path) - offset) // (numpy.dtype(dtype).itemsize * components)
+    if not count:
+        # empty files can not be mapped
+        return numpy.empty((0, components), dtype)
+    return numpy.memmap(
+        file_path,
+        dtype=dtype,
+        mode='r',
+        offset=offset,
+        shape=(count, components)
+    )
+
+
+def decode_channel(file, header, channel):
+    # returns (array, delta), delta is (step, reference) of the delta
+    # blocks, their array is the difference from the reference frame
+    file.seek(channel.offset)
+    data = decompress(file.read(channel.size), channel.compression)
+    delta = None
+    if channel.encoding == ENCODING_QUANTIZED:
+        params = QUANTIZATION.unpack_from(data)
+        data = memoryview(data)[QUANTIZATION.size : ]
+    elif channel.encoding == ENCODING_DELTA:
+        *step, name_size = DELTA.unpack_from(data)
+        reference = bytes(data[DELTA.size : DELTA.size + name_size]).decode()
+        data = memoryview(data)[DELTA.size + name_size : ]
+        delta = (step, reference)
+    array = numpy.frombuffer(data, dtype=channel.dtype)
+    array = array.reshape(header.count, channel.components)
+    if channel.encoding == ENCODING_QUANTIZED:
+        array = dequantize(array, params[ : 3], params[3 : ])
+    return array, delta
+
+
+def get_signature(file_path):
+    stat = os.stat(file_path)
+    return (stat.st_mtime_ns, stat.st_size)
+
+
+def get_cached(file_path, name, signature):
+    with decoded_lock:
+        entry = decoded.get((file_path, name))
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+
+
+def set_cached(file_path, name, signature, array):
+    array.flags.writeable = False
+    with decoded_lock:
+        decoded[(file_path, name)] = (signature, array)
+        while len(decoded) > DECODED_COUNT:
+            decoded.popitem(last=False)
+
+
+def get_decoded(file_path, name):
+    # recently decoded channels, sequential reads of delta frames
+    # only decode the last frame instead of the whole chain.
+    # the chain is walked back to a keyframe or a decoded frame,
+    # then the deltas are applied forward
+    chain = []
+    path = file_path
+    while True:
+        if not os.path.exists(path) or any(path == link[0] for link in chain):
+            raise ValueError('Invalid reference frame: "{}"'.format(path))
+        signature = get_signature(path)
+        array = get_cached(path, name, signature)
+        if array is not None:
+            break
+        with open(path, 'rb') as file:
+            header = read_header(file)
+            channel = header.channels.get(name)
+            if channel is None:
+                raise ValueError('Invalid reference frame: "{}"'.format(path))
+            array, delta = decode_channel(file, header, channel)
+        if delta is None:
+            set_cached(path, name, signature, array)
+            break
+        step, reference = delta
+        chain.append((path, signature, array, step))
+        path = os.path.join(os.path.dirname(path), reference)
+    for path, signature, data, step in reversed(chain):
+        if len(array) != len(data):
+            raise ValueError('Invalid reference frame: "{}"'.format(path))
+        array = apply_delta(array, data, step)
+        set_cached(path, name, signature, array)
+    return array
+
+
+def read_channel(file_path, name):
+    if not os.path.exists(file_path):
+        return
+    with open(file_path, 'rb') as file:
+        header = read_header(file)
+        channel = header.channels.get(name)
+        if channel is None:
+            return
+    if channel.encoding != ENCODING_RAW or channel.compression != COMPRESSION_NONE:
+        return get_decoded(file_path, name)
+    return map_array(
+        file_path,
+        channel.dtype,
+        channel.components,
+        offset=channel.offset,
+        count=header.count
+    )
+
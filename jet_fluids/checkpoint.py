@@ -0,0 +1,111 @@
+import os
+import re
+import json
+
+import numpy
+
+
+# checkpoints hold the solver state in jet axes and double precision,
+# so that a resumed bake continues exactly where it stopped
+BASE_NAME = 'checkpoint'
+KEEP_COUNT = 2
+PARTICLE_ARRAYS = ('positions', 'velocities', 'forces')
+GRID_AXES = ('u', 'v', 'w')
+
+
+def get_checkpoint_path(folder, frame):
+    return '{0}{1}_{2:0>6}.npz'.format(folder, BASE_NAME, frame)
+
+
+def get_checkpoint_frames(folder):
+    if not os.path.exists(folder):
+        return []
+    frames = []
+    for file_name in os.listdir(folder):
+        match = re.fullmatch(BASE_NAME + '_([0-9]+).npz', file_name)
+        if match:
+            frames.append(int(match.group(1)))
+    return sorted(frames)
+
+
+def clear(folder):
+    for frame in get_checkpoint_frames(folder):
+        os.remove(get_checkpoint_path(folder, frame))
+
+
+def get_grid_accessors(solver):
+    # grid velocity components, when pyjet exposes their buffers
+    try:
+        velocity = solver.gridSystemData.velocity
+        return [
+            numpy.array(getattr(velocity, axis + 'Accessor')(), copy=False)
+            for axis in GRID_AXES
+        ]
+    except (AttributeError, TypeError, ValueError):
+        return
+
+
+def get_arrays(solver, state, frame):
+    # copies of the solver state, the solver continues, while they are written
+    data = solver.particleSystemData
+    arrays = {
+        name: numpy.array(getattr(data, name))
+        for name in PARTICLE_ARRAYS
+    }
+    accessors = get_grid_accessors(solver)
+    if accessors is not None:
+        for axis, array in zip(GRID_AXES, accessors):
+            arrays['grid_' + axis] = array.copy()
+    state = dict(state, frame=frame, grid=accessors is not None)
+    arrays['state'] = numpy.array(json.dumps(state))
+    return arrays
+
+
+def write(folder, frame, arrays):
+    file_path = get_checkpoint_path(folder, frame)
+    temp_path = file_path + '.tmp'
+    with open(temp_path, 'wb') as file:
+        numpy.savez(file, **arrays)
+    os.replace(temp_path, file_path)
+    # older checkpoints are not needed, the last ones cover a crash
+    # during the write of the newest
+    for old_frame in get_checkpoint_frames(folder)[:-KEEP_COUNT]:
+        os.remove(get_checkpoint_path(folder, old_frame))
+    return file_path
+
+
+def load(file_path):
+    with numpy.load(file_path) as file:
+        state = json.loads(str(file['state']))
+        arrays = {name: file[name] for name in file.files if name != 'state'}
+    return arrays, state
+
+
+def find(folder, before_frame, settings):
+    # latest checkpoint before the frame, made with the same settings
+    for frame in reversed(get_checkpoint_frames(folder)):
+        if frame >= before_frame:
+            continue
+        file_path = get_checkpoint_path(folder, frame)
+        try:
+            arrays, state = load(file_path)
+        except (OSError, ValueError, KeyError) as error:
+            print('Skip checkpoint "{0}": {1}'.format(file_path, error))
+            continue
+        if state.get('settings') != settings:
+            print('Skip checkpoint "{0}": solver settings changed'.format(file_path))
+            continue
+        return arrays, state
+
+
+def restore(solver, arrays, state):
+    solver.particleSystemData.addParticles(
+        *(arrays[name].tolist() for name in PARTICLE_ARRAYS)
+    )
+    if state['grid']:
+        accessors = get_grid_accessors(solver)
+        if accessors is None:
+            print('Grid velocity of the checkpoint is not restored')
+        else:
+            for axis, array in zip(GRID_AXES, accessors):
+                array[...] = arrays['grid_' + axis]
@@ -0,0 +1,210 @@
+import os
+import sys
+
+if not __package__:
+    # run as a script: blender -b scene.blend --python jet_fluids/cli.py -- ...
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    __package__ = 'jet_fluids'
+
+import json
+import time
+import argparse
+import threading
+
+import bpy
+
+
+USAGE = '''
+blender -b scene.blend --python-expr "from jet_fluids import cli; cli.main()" -- --domain Cube --stage mesh --frames 1-240
+blender -b scene.blend --python jet_fluids/cli.py -- --domain Cube --config bake.json'''
+
+# exit codes
+EXIT_OK = 0
+EXIT_FAILED = 1
+EXIT_USAGE = 2
+EXIT_INVALID_SCENE = 3
+
+STAGES = ('particles', 'mesh')
+# events of the writer threads are written whole, one after another
+output_lock = threading.Lock()
+
+
+class CliError(Exception):
+    pass
+
+
+def emit(event, **data):
+    # progress for the render farm, one json object per line
+    # the time of the event, "time" of the frames is their duration
+    data['event'] = event
+    data['timestamp'] = time.time()
+    line = json.dumps(data) + '\n'
+    with output_lock:
+        sys.stdout.write(line)
+        sys.stdout.flush()
+
+
+def parse_frames(text):
+    # "1-240", "1-10,15,20-30"
+    frames = set()
+    try:
+        for part in text.split(','):
+            start, _, end = part.partition('-')
+            start = int(start)
+            end = int(end) if end else start
+            if end < start:
+                raise ValueError(part)
+            frames.update(range(start, end + 1))
+    except ValueError:
+        raise argparse.ArgumentTypeError('invalid frames: "{}"'.format(text))
+    return sorted(frames)
+
+
+def parse_args(argv):
+    parser = argparse.ArgumentParser(prog='jet_fluids.cli', usage=USAGE)
+    parser.add_argument('--domain', required=True, help='domain object name')
+    parser.add_argument('--stage', choices=STAGES + ('all', ), default='all')
+    parser.add_argument('--frames', type=parse_frames, help='frames, for example: 1-100,120')
+    parser.add_argument('--config', help='json config, exported from the domain')
+    parser.add_argument('--export-config', help='write the domain config to the json file and exit')
+    parser.add_argument('--cache-folder', help='overrides the cache folder of the domain')
+    parser.add_argument('--overwrite', action='store_true', help='bake cached frames again')
+    parser.add_argument('--workers', type=int, help='mesh worker processes, 0 - all cores')
+    return parser.parse_args(argv)
+
+
+def get_domain(name):
+    obj = bpy.data.objects.get(name)
+    if obj is None:
+        raise CliError('Object not found: "{}"'.format(name))
+    if not obj.jet_fluid.is_active or obj.jet_fluid.object_type != 'DOMAIN':
+        raise CliError('Object is not a jet fluid domain: "{}"'.format(name))
+    return obj
+
+
+def bake_particles(domain, frames):
+    from . import bake_particles
+
+    jet = domain.jet_fluid
+    if frames:
+        if frames != list(range(frames[0], frames[-1] + 1)):
+            raise CliError('Particles stage needs a continuous frame range')
+        jet.frame_range_simulation = 'CUSTOM'
+        jet.frame_range_simulation_start = frames[0]
+        jet.frame_range_simulation_end = frames[-1]
+    bpy.context.view_layer.objects.active = domain
+
+    def progress(frame, entry):
+        emit('frame', stage='particles', frame=frame, **entry)
+
+    bake_particles.progress = progress
+    try:
+        status = bpy.ops.jet_fluid.bake_particles()
+    finally:
+        bake_particles.progress = None
+    return 'FINISHED' in status
+
+
+def bake_mesh(domain, frames, workers):
+    from . import bake
+    from . import bake_mesh
+    from . import core
+    from . import profiler
+
+    jet = domain.jet_fluid
+    if not frames:
+        if jet.frame_range_mesh == 'CUSTOM':
+            frames = range(jet.frame_range_mesh_start, jet.frame_range_mesh_end + 1)
+        else:
+            frames = range(bpy.context.scene.frame_start, bpy.context.scene.frame_end + 1)
+    if workers is None:
+        workers = jet.mesh_workers
+
+    def progress(done_count, frames_count, result):
+        emit('frame', stage='mesh', done=done_count, total=frames_count, **result)
+
+    params = bake_mesh.get_mesh_params(domain)
+    profiler.start(jet.profiling)
+    try:
+        failed = core.bake_mesh(
+            bake.get_domain(domain),
+            params,
+            frames,
+            overwrite=jet.overwrite_mesh,
+            workers=workers,
+            memory_limit=jet.mesh_worker_memory,
+            progress=progress
+        )
+    finally:
+        profiler.finish('MESH', params['cache_folder'], 'mesh')
+    return not failed
+
+
+def run(args):
+    if not hasattr(bpy.types.Object, 'jet_fluid'):
+        # the add-on is installed, but not enabled in the preferences
+        import jet_fluids
+        jet_fluids.register()
+    from . import objects
+
+    domain = get_domain(args.domain)
+    jet = domain.jet_fluid
+    if args.export_config:
+        with open(args.export_config, 'w') as file:
+            json.dump(objects.get_config(jet), file, indent=4, sort_keys=True)
+        emit('export', path=args.export_config)
+        return EXIT_OK
+    if args.config:
+        try:
+            with open(args.config) as file:
+                objects.set_config(jet, json.load(file))
+        except (OSError, ValueError, KeyError, TypeError) as error:
+            raise CliError('Invalid config "{0}": {1}'.format(args.config, error))
+    if args.cache_folder:
+        jet.cache_folder = args.cache_folder
+    if not jet.cache_folder:
+        raise CliError('Cache Folder not Specified!')
+    if args.overwrite:
+        jet.overwrite_simulation = True
+        jet.overwrite_mesh = True
+    if args.stage == 'all':
+        stages = STAGES
+    else:
+        stages = (args.stage, )
+    for stage in stages:
+        emit('start', stage=stage, domain=domain.name)
+        start_time = time.time()
+        if stage == 'particles':
+            success = bake_particles(domain, args.frames)
+        else:
+            success = bake_mesh(domain, args.frames, args.workers)
+        emit('end', stage=stage, success=success, seconds=time.time() - start_time)
+        if not success:
+            return EXIT_FAILED
+    return EXIT_OK
+
+
+def main(argv=None):
+    if argv is None:
+        # blender arguments end with "--"
+        if '--' in sys.argv:
+            argv = sys.argv[sys.argv.index('--') + 1 : ]
+        else:
+            argv = []
+    try:
+        args = parse_args(argv)
+    except SystemExit as error:
+        sys.exit(EXIT_OK if error.code == 0 else EXIT_USAGE)
+    try:
+        code = run(args)
+    except CliError as error:
+        emit('error', message=str(error))
+        code = EXIT_INVALID_SCENE
+    except Exception as error:
+        emit('error', message='{0}: {1}'.format(type(error).__name__, error))
+        code = EXIT_FAILED
+    sys.exit(code)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import math
+import itertools
+
+import numpy
+
+
+# numpy points to implicit converters, the particles are binned by the
+# grid cells and splatted into the nodes near them. data is the array of
+# the grid nodes with (z, y, x) axes, as pyjet exposes the grid buffer,
+# values are written into it in place. the fields match the pyjet
+# converters without the signed distance reinitialization
+CHUNK_SIZE = 65536
+
+
+def get_values(data):
+    # flat view of the nodes, a copy for the strided buffers
+    return data.reshape(-1)
+
+
+def set_values(data, values):
+    if not numpy.may_share_memory(data, values):
+        data[...] = values.reshape(data.shape)
+
+
+def get_neighbours(points, shape, origin, spacing, radius, with_deltas=False):
+    # yields (nodes, squares, deltas): flat indices of the nodes closer to
+    # the particles than the radius, squared distances and the vectors
+    # from the nodes to the particles by the axes
+    points = numpy.asarray(points, dtype=numpy.float64).reshape(-1, 3)
+    size = shape[::-1]
+    strides = (1, shape[2], shape[1] * shape[2])
+    coords = (points - numpy.asarray(origin, dtype=numpy.float64)) / spacing
+    cells = numpy.floor(coords).astype(numpy.int64)
+    # particles of one cell write into the same nodes one after another
+    keys = numpy.ravel_multi_index(numpy.clip(cells, 0, numpy.array(size) - 1)[:, ::-1].T, shape)
+    order = numpy.argsort(keys, kind='stable')
+    reach = int(math.ceil(radius / spacing))
+    steps = range(-reach, reach + 1)
+    # offsets of the nodes, that can be closer than the radius to the cell
+    offsets = [
+        offset for offset in itertools.product(steps, repeat=3)
+        if sum(max(step - 1, -step, 0) ** 2 for step in offset) * spacing * spacing < radius * radius
+    ]
+    for start in range(0, len(order), CHUNK_SIZE):
+        chunk = order[start : start + CHUNK_SIZE]
+        axes = []
+        for axis in range(3):
+            # per axis and offset: flat index parts, deltas and their squares
+            axis_coords = coords[chunk, axis]
+            axis_cells = cells[chunk, axis]
+            axis_steps = {}
+            for step in steps:
+                nodes = axis_cells + step
+                deltas = (axis_coords - nodes) * spacing
+                squares = deltas * deltas
+                squares[(nodes < 0) | (nodes >= size[axis])] = numpy.inf
+                axis_steps[step] = (nodes * strides[axis], deltas, squares)
+            axes.append(axis_steps)
+        for offset in offsets:
+            nodes, deltas, squares = zip(*(axis_steps[step] for axis_steps, step in zip(axes, offset)))
+            squares = squares[0] + squares[1] + squares[2]
+            inside = numpy.flatnonzero(squares < radius * radius)
+            if not len(inside):
+                continue
+            nodes = nodes[0][inside] + nodes[1][inside] + nodes[2][inside]
+            if with_deltas:
+                deltas = tuple(axis_deltas[inside] for axis_deltas in deltas)
+            else:
+                deltas = None
+            yield nodes, squares[inside], deltas
+
+
+class SphericalPointsToImplicit:
+    def __init__(self, radius):
+        self.radius = radius
+
+    def convert(self, points, data, origin, spacing):
+        # distance to the nearest particle in the band of two radiuses
+        band = 2.0 * self.radius
+        values = get_values(data)
+        values.fill(band * band)
+        for nodes, squares, _ in get_neighbours(points, data.shape, origin, spacing, band):
+            numpy.minimum.at(values, nodes, squares)
+        numpy.sqrt(values, out=values)
+        values -= self.radius
+        set_values(data, values)
+
+
+class ZhuBridsonPointsToImplicit:
+    def __init__(self, kernel_radius, cut_off_threshold):
+        self.kernel_radius = kernel_radius
+        self.cut_off_threshold = cut_off_threshold
+
+    def convert(self, points, data, origin, spacing):
+        # distance to the kernel weighted average of the particles,
+        # the sums are relative to the nodes: weights and weighted deltas
+        # by the axes, kept only for the nodes near the particles. their
+        # indices in the sums are stored in the values until the end
+        radius = self.kernel_radius
+        values = get_values(data)
+        values.fill(-1.0)
+        nodes = [numpy.empty(0, dtype=numpy.int64)]
+        count = 0
+        sums = numpy.zeros((4, CHUNK_SIZE))
+        neighbours = get_neighbours(points, data.shape, origin, spacing, radius, with_deltas=True)
+        for chunk_nodes, squares, deltas in neighbours:
+            indices = values[chunk_nodes]
+            new_nodes = numpy.unique(chunk_nodes[indices < 0.0])
+            if len(new_nodes):
+                values[new_nodes] = numpy.arange(count, count + len(new_nodes))
+                nodes.append(new_nodes)
+                count += len(new_nodes)
+                if count > sums.shape[1]:
+                    grown = numpy.zeros((4, max(2 * sums.shape[1], count)))
+                    grown[:, : sums.shape[1]] = sums
+                    sums = grown
+                indices = values[chunk_nodes]
+            indices = indices.astype(numpy.int64)
+            weights = 1.0 - squares / (radius * radius)
+            weights *= weights * weights
+            numpy.add.at(sums[0], indices, weights)
+            for axis_sums, axis_deltas in zip(sums[1:], deltas):
+                numpy.add.at(axis_sums, indices, axis_deltas * weights)
+        nodes = numpy.concatenate(nodes)
+        sums = sums[:, :count]
+        distances = numpy.linalg.norm(sums[1:] / sums[0], axis=0)
+        # nodes without particles get the grid diagonal, as in pyjet
+        diagonal = numpy.linalg.norm((numpy.array(data.shape) - 1) * spacing)
+        values.fill(diagonal)
+        values[nodes] = distances - self.cut_off_threshold * radius
+        set_values(data, values)
+
+
+CONVERTERS = (SphericalPointsToImplicit, ZhuBridsonPointsToImplicit)
@@ -0,0 +1,612 @@
+import os
+import math
+import time
+import hashlib
+
+import numpy
+
+from . import pyjet
+from . import cache
+from . import checkpoint
+from . import manifest
+from . import mesher
+from . import profiler
+from . import telemetry
+from .utils import print_info, convert_time_to_string
+
+
+# particle and mesh bakes from plain data, without bpy (blender axes):
+#     domain: origin (minimum corner), size, location and
+#         frames: {frame: {'viscosity'}}
+#     emitters and colliders: name, points (scaled, object space),
+#         triangles, options and frames: {frame: state}, where the state
+#         has translation, rotation (quaternion w, x, y, z) and
+#         velocity, enabled (emitters) or friction (colliders)
+#     deforming colliders: geometries: {key: (points, triangles)} and
+#         the geometry key in every frame state
+#     settings: solver and cache options, see bake_particles.get_settings
+solvers = {
+    'APIC': pyjet.ApicSolver3,
+    'PIC': pyjet.PicSolver3,
+    'FLIP': pyjet.FlipSolver3
+}
+advection_solvers = {
+    'SEMI_LAGRANGIAN': pyjet.SemiLagrangian3,
+    'CUBIC_SEMI_LAGRANGIAN': pyjet.CubicSemiLagrangian3
+}
+diffusion_solvers = {
+    'FORWARD_EULER': pyjet.GridForwardEulerDiffusionSolver3,
+    'BACKWARD_EULER': pyjet.GridBackwardEulerDiffusionSolver3
+}
+pressure_solvers = {
+    'FRACTIONAL_SINGLE_PHASE': pyjet.GridFractionalSinglePhasePressureSolver3,
+    'SINGLE_PHASE': pyjet.GridSinglePhasePressureSolver3
+}
+# order of the boundary flags: right, left, front, back, up, down
+DIRECTIONS = (
+    pyjet.DIRECTION_RIGHT,
+    pyjet.DIRECTION_LEFT,
+    pyjet.DIRECTION_FRONT,
+    pyjet.DIRECTION_BACK,
+    pyjet.DIRECTION_UP,
+    pyjet.DIRECTION_DOWN
+)
+MESH_PARAMS = (
+    'converter_type',
+    'kernel_radius',
+    'cut_off_density',
+    'position_smoothing_factor',
+    'min_num_neighbors',
+    'is_output_sdf',
+    'radius',
+    'cut_off_threshold',
+    'iso_value',
+    'mesh_sparse_grid',
+    'mesh_tile_size'
+)
+SURFACE_MARGIN = 0.2
+
+# voxelized emitter and collider surfaces of the previous bakes:
+# {name: (key, surface)}, the transform is set again by every bake
+surfaces = {}
+
+
+def swap(vector):
+    # blender axes to jet axes and back
+    return vector[0], vector[2], vector[1]
+
+
+def get_boundary_flag(bounds):
+    bound_flag = 0
+    for bound, flag in zip(bounds, DIRECTIONS):
+        if bound:
+            bound_flag |= flag
+    return bound_flag
+
+
+def calc_res(domain, resolution):
+    # returns the grid resolution along the blender axes and the max size
+    max_size = max(domain['size'])
+    return tuple(
+        int(round((size / max_size) * resolution, 1))
+        for size in domain['size']
+    ), max_size
+
+
+def get_domain_bounds(domain):
+    # bounds relative to the domain location
+    bounds_min = [
+        origin - location
+        for origin, location in zip(domain['origin'], domain['location'])
+    ]
+    bounds_max = [
+        bound + size
+        for bound, size in zip(bounds_min, domain['size'])
+    ]
+    return bounds_min, bounds_max
+
+
+def get_state(source, frame):
+    states = source['frames']
+    state = states.get(frame)
+    if state is None:
+        # frames outside of the baked range use the nearest state
+        state = states[min(states, key=lambda index: abs(index - frame))]
+    return state
+
+
+def get_transform(state):
+    rot = state['rotation']
+    return pyjet.Transform3(
+        translation=swap(state['translation']),
+        orientation=(-rot[0], rot[1], rot[3], rot[2])
+    )
+
+
+@profiler.profile('Create solver')
+def create_solver(settings, domain):
+    (resolution_x, resolution_y, resolution_z), _ = calc_res(domain, settings['resolution'])
+    solver = solvers[settings['solver_type']](
+        resolution=(resolution_x, resolution_z, resolution_y),
+        gridOrigin=swap(domain['origin']),
+        domainSizeX=domain['size'][0]
+    )
+    solver.maxCfl = settings['max_cfl']
+    solver.advectionSolver = advection_solvers[settings['advection_solver_type']]()
+    solver.diffusionSolver = diffusion_solvers[settings['diffusion_solver_type']]()
+    solver.pressureSolver = pressure_solvers[settings['pressure_solver_type']]()
+    solver.useCompressedLinearSystem = settings['compressed_linear_system']
+    solver.isUsingFixedSubTimeSteps = settings['fixed_substeps']
+    solver.numberOfFixedSubTimeSteps = settings['fixed_substeps_count']
+    solver.closedDomainBoundaryFlag = get_boundary_flag(settings['closed_boundary'])
+    solver.viscosityCoefficient = settings['viscosity']
+    solver.gravity = swap(settings['gravity'])
+    return solver
+
+
+def get_surface_key(points, triangles, resolution_x, margin):
+    # points are scaled, so the key changes with the object scale too
+    geometry_hash = hashlib.blake2b(digest_size=16)
+    geometry_hash.update(numpy.ascontiguousarray(points, dtype=numpy.float64))
+    geometry_hash.update(numpy.ascontiguousarray(triangles, dtype=numpy.int64))
+    geometry_hash.update('{0}:{1}'.format(resolution_x, margin).encode())
+    return geometry_hash.hexdigest()
+
+
+def prune_surfaces(names):
+    # surfaces of the objects, that are not in the bake, are released
+    for name in set(surfaces) - set(names):
+        del surfaces[name]
+
+
+def create_surface(source, solver, domain):
+    points = numpy.asarray(source['points'], dtype=numpy.float64).reshape(-1, 3)
+    triangles = numpy.asarray(source['triangles']).reshape(-1, 3)
+    if len(points):
+        size_x = numpy.ptp(points[:, 0])
+    else:
+        size_x = 0.0
+    resolution_x = int(round(solver.resolution.x * size_x / domain['size'][0], 0))
+    key = get_surface_key(points, triangles, resolution_x, SURFACE_MARGIN)
+    cached = surfaces.get(source['name'])
+    if cached and cached[0] == key:
+        print_info('        Reuse implicit surface: "{0}"'.format(source['name']))
+        return cached[1]
+    with profiler.scope('Triangle mesh'):
+        # swapped axes flip the winding, so the triangles are reversed too
+        triangle_mesh = pyjet.TriangleMesh3(
+            points=points[:, (0, 2, 1)].tolist(),
+            pointIndices=triangles[:, (0, 2, 1)].tolist()
+        )
+    with profiler.scope('Implicit triangle mesh'):
+        imp_triangle_mesh = pyjet.ImplicitTriangleMesh3(
+            mesh=triangle_mesh,
+            resolutionX=resolution_x,
+            margin=SURFACE_MARGIN
+        )
+    surfaces[source['name']] = (key, imp_triangle_mesh)
+    return imp_triangle_mesh
+
+
+def get_geometry(source, state):
+    # source with the points and the triangles of the frame
+    key = state.get('geometry')
+    if key is None:
+        return source
+    points, triangles = source['geometries'][key]
+    return dict(source, points=points, triangles=triangles)
+
+
+def read_particles(file_path):
+    header = cache.get_header(file_path)
+    if header is None:
+        print_info('Can\'t find file: "{}"'.format(file_path))
+        return
+    data = []
+    for channel in ('pos', 'vel', 'force'):
+        array = cache.read_channel(file_path, channel)
+        if channel == 'pos':
+            array = array + header.origin
+        # cache stores blender axes, solver uses jet axes
+        data.append(array[:, (0, 2, 1)].tolist())
+    return data
+
+
+class Simulation:
+    def __init__(self, settings, domain, emitters, colliders, progress=None):
+        # progress(frame, entry) is called after each saved frame
+        self.settings = settings
+        self.domain = domain
+        self.emitters = emitters
+        self.colliders = colliders
+        self.progress = progress
+        prune_surfaces(source['name'] for source in emitters + colliders)
+        self.cache_folder = settings['cache_folder']
+        self.time_interval = settings['time_interval']
+        self.solver = create_solver(settings, domain)
+        self.frame = pyjet.Frame(0, self.time_interval)
+        self.jet_emitters = {}
+        self.jet_colliders = []
+        self.collider_geometries = {}
+        resolution, self.domain_max_size = calc_res(domain, settings['resolution'])
+        self.grid_spacing = domain['size'][0] / resolution[0]
+        # checkpoints are valid only for the same solver settings
+        self.checkpoint_settings = {
+            'solver_type': settings['solver_type'],
+            'resolution': list(resolution),
+            'origin': list(domain['origin']),
+            'domain_size_x': domain['size'][0],
+            'time_interval': self.time_interval
+        }
+
+    @profiler.profile('Create emitters')
+    def create_emitters(self, frame, skip_one_shot=False):
+        solver = self.solver
+        for source in self.emitters:
+            if skip_one_shot and source['one_shot']:
+                continue
+            print_info('    Create emitter: "{0}"'.format(source['name']))
+            triangle_mesh = create_surface(source, solver, self.domain)
+            state = get_state(source, frame)
+            with profiler.scope('Particle emitter'):
+                emitter = pyjet.VolumeParticleEmitter3(
+                    implicitSurface=triangle_mesh,
+                    maxRegion=solver.gridSystemData.boundingBox,
+                    spacing=self.domain_max_size / (self.settings['resolution'] * source['particles_count']),
+                    isOneShot=source['one_shot'],
+                    isEnable=state['enabled'],
+                    initialVelocity=list(swap(state['velocity'])),
+                    jitter=source['jitter'],
+                    allowOverlapping=source['allow_overlapping'],
+                    seed=source['seed'],
+                    maxNumberOfParticles=source['max_number_of_particles']
+                )
+            self.jet_emitters[source['name']] = emitter
+        emitter_set = pyjet.ParticleEmitterSet3(emitters=list(self.jet_emitters.values()))
+        solver.particleEmitter = emitter_set
+
+    @profiler.profile('Create colliders')
+    def create_colliders(self, frame):
+        for source in self.colliders:
+            print_info('    Create collider: "{0}"'.format(source['name']))
+            state = get_state(source, frame)
+            self.jet_colliders.append((self.create_collider(source, state), source))
+        if self.jet_colliders:
+            self.set_colliders()
+
+    def create_collider(self, source, state):
+        triangle_mesh = create_surface(get_geometry(source, state), self.solver, self.domain)
+        triangle_mesh.transform = get_transform(state)
+        collider = pyjet.RigidBodyCollider3(surface=triangle_mesh)
+        collider.frictionCoefficient = state['friction']
+        self.collider_geometries[source['name']] = state.get('geometry')
+        return collider
+
+    def set_colliders(self):
+        collider_set = pyjet.ColliderSet3()
+        for collider, _ in self.jet_colliders:
+            collider_set.addCollider(collider)
+        self.solver.collider = collider_set
+
+    def run(self, frame_start, frame_end):
+        # raises cache.CacheWriteError, when frames can not be saved
+        settings = self.settings
+        self.frame_start = frame_start
+        self.frame_end = frame_end
+        self.checkpoint_settings['frame_start'] = frame_start
+        if not os.path.exists(self.cache_folder):
+            os.makedirs(self.cache_folder)
+        self.manifest = manifest.get_manifest(self.cache_folder)
+
+        if settings['overwrite']:
+            resume_frame = frame_start
+        else:
+            missing_frames = self.manifest.get_missing_frames(manifest.PARTICLES, frame_start, frame_end)
+            resume_frame = missing_frames[0] if missing_frames else None
+            if resume_frame is not None and resume_frame != frame_start:
+                print_info('Skip frames: {0}-{1}'.format(frame_start, resume_frame - 1))
+        if resume_frame is None:
+            print_info('All frames are cached')
+            return
+
+        if resume_frame == frame_start:
+            # checkpoints of the previous bake do not match the new one
+            checkpoint.clear(self.cache_folder)
+            saved = None
+        else:
+            saved = checkpoint.find(self.cache_folder, resume_frame, self.checkpoint_settings)
+        if resume_frame == frame_start:
+            self.create_emitters(frame_start)
+            self.create_colliders(frame_start)
+            offset = frame_start
+        elif saved:
+            self.create_emitters(saved[1]['frame'])
+            self.create_colliders(saved[1]['frame'])
+            offset = self.resume_checkpoint(*saved)
+        else:
+            print_info('Checkpoint not found, resume from the particles cache')
+            # one shot emitters have already emitted their particles
+            self.create_emitters(resume_frame, skip_one_shot=True)
+            self.create_colliders(resume_frame)
+            self.resume_particles(cache.get_frame_path(self.cache_folder, 'particles', resume_frame - 1))
+            offset = resume_frame
+        self.telemetry = telemetry.get_telemetry(self.cache_folder)
+        self.telemetry.start({
+            'start': time.time(),
+            'frame_start': self.frame.index + offset,
+            'frame_end': frame_end,
+            'solver_type': settings['solver_type'],
+            'resolution': settings['resolution'],
+            'max_cfl': settings['max_cfl'],
+            'fixed_substeps': settings['fixed_substeps'],
+            'fixed_substeps_count': settings['fixed_substeps_count'],
+            'time_interval': self.time_interval
+        })
+        self.simulate(offset)
+
+    @profiler.profile('Resume checkpoint')
+    def resume_checkpoint(self, arrays, state):
+        # returns the frame offset of the resumed simulation
+        print_info('Resume checkpoint: frame {0}'.format(state['frame']))
+        checkpoint.restore(self.solver, arrays, state)
+        for name, is_enabled in state['emitters'].items():
+            emitter = self.jet_emitters.get(name)
+            if emitter:
+                emitter.isEnabled = is_enabled
+        frame_index = state['frame_index']
+        try:
+            # the solver continues without initialization, as in the original run
+            self.solver.currentFrame = pyjet.Frame(frame_index, self.time_interval)
+        except (AttributeError, TypeError):
+            print_info('Solver frame can not be restored, the solver is initialized again')
+            offset = state['frame'] + 1
+        else:
+            self.frame = pyjet.Frame(frame_index + 1, self.time_interval)
+            offset = state['offset']
+        return offset
+
+    @profiler.profile('Resume particles')
+    def resume_particles(self, file_path):
+        # approximate resume from the cached particles, without the grid state
+        pos, vel, forc = read_particles(file_path)
+        self.solver.particleSystemData.addParticles(pos, vel, forc)
+
+    def save_checkpoint(self, offset):
+        frame = self.frame.index + offset
+        state = {
+            'settings': self.checkpoint_settings,
+            'offset': offset,
+            'frame_index': self.frame.index,
+            'emitters': {
+                name: emitter.isEnabled
+                for name, emitter in self.jet_emitters.items()
+            }
+        }
+        # the copies are written by the frames writer, after the particles
+        # of the frame, the solver does not wait for the disk
+        with profiler.scope('Save checkpoint'):
+            arrays = checkpoint.get_arrays(self.solver, state, frame)
+            self.writer.call(
+                checkpoint.get_checkpoint_path(self.cache_folder, frame),
+                checkpoint.write,
+                self.cache_folder,
+                frame,
+                arrays
+            )
+
+    def simulate(self, offset):
+        settings = self.settings
+        bounds_min, bounds_max = get_domain_bounds(self.domain)
+        self.delta_encoder = cache.DeltaEncoder(
+            bounds_min,
+            bounds_max,
+            settings['cache_tolerance'],
+            settings['cache_keyframe_interval']
+        )
+        checkpoint_interval = settings['checkpoint_interval']
+        writer = cache.FrameWriter()
+        self.writer = writer
+        try:
+            while self.frame.index + offset <= self.frame_end:
+                self.simulate_frame(offset)
+                frame_number = self.frame.index + offset - self.frame_start + 1
+                if checkpoint_interval and not frame_number % checkpoint_interval:
+                    self.save_checkpoint(offset)
+                self.frame.advance()
+            writer.close()
+            writer.check()
+        finally:
+            writer.close()
+            if writer.frames_count:
+                print_info('Save particles: {0:.3f} sec per frame, solver waited {1:.3f} sec per frame, recovered {2:.3f} sec per frame'.format(
+                    writer.write_time / writer.frames_count,
+                    writer.wait_time / writer.frames_count,
+                    (writer.write_time - writer.wait_time) / writer.frames_count
+                ))
+
+    def update_sources(self, frame):
+        for source in self.emitters:
+            jet_emitter = self.jet_emitters.get(source['name'])
+            if not jet_emitter:
+                continue
+            state = get_state(source, frame)
+            jet_emitter.initialVelocity = swap(state['velocity'])
+            jet_emitter.isOneShot = source['one_shot']
+            if source['one_shot']:
+                # one shot emitters emit only in the frame, where they become enabled
+                previous = source['frames'].get(frame - 1)
+                jet_emitter.isEnabled = state['enabled'] and not (previous and previous['enabled'])
+            else:
+                jet_emitter.isEnabled = state['enabled']
+            jet_emitter.surface.transform = get_transform(state)
+            jet_emitter.linearVelocity = (0, 0, 0)
+
+        # deforming colliders are built again, when their geometry changed,
+        # the other frames only move the surface, returns the rebuild time
+        rebuild_time = 0.0
+        rebuilt = False
+        for index, (collider, source) in enumerate(self.jet_colliders):
+            state = get_state(source, frame)
+            if state.get('geometry') != self.collider_geometries[source['name']]:
+                rebuild_start = time.perf_counter()
+                with profiler.scope('Rebuild collider'):
+                    collider = self.create_collider(source, state)
+                self.jet_colliders[index] = (collider, source)
+                rebuild_time += time.perf_counter() - rebuild_start
+                rebuilt = True
+            collider.frictionCoefficient = state['friction']
+            collider.surface.transform = get_transform(state)
+        if rebuilt:
+            self.set_colliders()
+        return rebuild_time
+
+    def get_substeps(self):
+        # the solver splits the frame by the cfl of the grid velocities
+        # at the frame start
+        settings = self.settings
+        if settings['fixed_substeps']:
+            return settings['fixed_substeps_count']
+        try:
+            cfl = self.solver.cfl(self.time_interval)
+        except (AttributeError, TypeError):
+            return
+        return max(int(math.ceil(cfl / settings['max_cfl'])), 1)
+
+    @profiler.profile('Frame')
+    def simulate_frame(self, offset):
+        solv = self.solver
+        settings = self.settings
+        frame = self.frame.index + offset
+        print_info('Frame', frame)
+        with profiler.scope('Update sources'):
+            rebuild_time = self.update_sources(frame)
+        solv.viscosityCoefficient = get_state(self.domain, frame)['viscosity']
+        substeps = self.get_substeps()
+        with profiler.scope('Solver update'):
+            update_start = time.perf_counter()
+            solv.update(self.frame)
+            update_time = time.perf_counter() - update_start
+        with profiler.scope('Encode particles'):
+            par_path, channels, entry = self.encode_particles(frame)
+        cfl = entry['max_speed'] * self.time_interval / self.grid_spacing
+        entry.update(
+            rebuild_time=rebuild_time,
+            update_time=update_time,
+            substeps=substeps,
+            cfl=cfl,
+            substep_cfl=cfl / substeps if substeps else None
+        )
+        # waits, while the writer is busy with the previous frame
+        with profiler.scope('Queue particles'):
+            self.writer.write(
+                par_path,
+                channels,
+                callback=lambda info: self.update_manifest(frame, entry, info),
+                origin=tuple(self.domain['location']),
+                compression=settings['cache_compression']
+            )
+
+    def encode_particles(self, frame):
+        # returns the file path, the channels and the manifest entry
+        solv = self.solver
+        settings = self.settings
+        positions = numpy.array(solv.particleSystemData.positions, copy=False)
+        velocities = numpy.array(solv.particleSystemData.velocities, copy=False)
+        forces = numpy.array(solv.particleSystemData.forces, copy=False)
+        vertices_count = len(positions)
+
+        # converted arrays are copies, so the solver can run the next
+        # frame while the writer thread saves this one
+        location = tuple(self.domain['location'])
+        positions = cache.convert_array(positions, numpy.float32, offset=location)
+        par_path = cache.get_frame_path(self.cache_folder, 'particles', frame)
+        if vertices_count:
+            max_speed = float(numpy.sqrt(numpy.einsum('ij,ij->i', velocities, velocities).max()))
+        else:
+            max_speed = 0.0
+        entry = {
+            'count': vertices_count,
+            'bounds': manifest.get_bounds(positions),
+            'max_speed': max_speed
+        }
+        if settings['cache_positions'] == 'QUANTIZED':
+            bounds_min, bounds_max = get_domain_bounds(self.domain)
+            positions = cache.quantize_array(
+                positions,
+                bounds_min,
+                bounds_max,
+                settings['cache_tolerance']
+            )
+        elif settings['cache_positions'] == 'DELTA':
+            positions = self.delta_encoder.encode(positions, par_path)
+        if settings['cache_velocities'] == 'HALF':
+            data_type = numpy.float16
+        else:
+            data_type = numpy.float32
+        channels = (
+            ('pos', positions),
+            ('vel', cache.convert_array(velocities, data_type)),
+            ('force', cache.convert_array(forces, data_type))
+        )
+        return par_path, channels, entry
+
+    def update_manifest(self, frame, entry, info):
+        # called in the writer thread
+        profiler.profiler.add('Write particles', info['write_time'])
+        entry.update(
+            size=info['size'],
+            checksum=info['checksum'],
+            channels=info['channels'],
+            save_time=info['write_time']
+        )
+        self.manifest.update(manifest.PARTICLES, frame, entry)
+        self.telemetry.add(frame, dict(entry, particles=entry['count']))
+        if self.progress:
+            self.progress(frame, entry)
+
+
+def simulate(settings, domain, emitters, colliders, frame_start, frame_end, progress=None):
+    print_info('-' * 79)
+    print_info('SIMULATION START')
+    start_time = time.time()
+    pyjet.Logging.mute()
+    simulation = Simulation(settings, domain, emitters, colliders, progress)
+    simulation.run(frame_start, frame_end)
+    print_info('-' * 79)
+    print_info('SIMULATION END')
+    print_info('Total time: {0}'.format(convert_time_to_string(start_time)))
+
+
+def get_mesh_settings(domain, params):
+    # params: cache_folder, resolution, resolution_mesh, close_boundary,
+    # connectivity_boundary and the converter options from MESH_PARAMS
+    (resolution_x, _, _), _ = calc_res(domain, params['resolution'])
+    # grid spacing of the simulation solver
+    grid_spacing = domain['size'][0] / resolution_x
+    resolution, _ = calc_res(domain, params['resolution_mesh'])
+    settings = {name: params[name] for name in MESH_PARAMS}
+    settings.update(
+        cache_folder=params['cache_folder'],
+        resolution=swap(resolution),
+        origin=swap(domain['origin']),
+        domain_size_x=domain['size'][0],
+        grid_spacing=grid_spacing,
+        location=tuple(domain['location']),
+        scale_coefficient=params['resolution'] / params['resolution_mesh'],
+        close_flag=get_boundary_flag(params['close_boundary']),
+        connectivity_flag=get_boundary_flag(params['connectivity_boundary'])
+    )
+    return settings
+
+
+def bake_mesh(domain, params, frames, overwrite=False, workers=1, memory_limit=0, progress=None):
+    # returns the list of frames, that failed
+    settings = get_mesh_settings(domain, params)
+    return mesher.bake_outdated_frames(
+        settings,
+        frames,
+        overwrite=overwrite,
+        workers=workers,
+        memory_limit=memory_limit,
+        progress=progress
+    )
@@ -3,10 +3,13 @@ import numpy
 
 import bpy
 
-from . import utils
+from . import bake
+from . import cache
+from . import profiler
+from . import frame_cache
 
 
-@utils.time_stats('Clear Fluid Geometry')
+@profiler.profile('Clear fluid geometry')
 def clear_fluid_geometry(domain, mode):
     if mode == 'PART':
         # particles mode
@@ -21,7 +24,7 @@ def clear_fluid_geometry(domain, mode):
                 obj.data.clear_geometry()
 
 
-@utils.time_stats('Get Domain Objects')
+@profiler.profile('Get domain objects')
 def get_domain_objects():
     obj_names = {obj.name for obj in bpy.data.objects}
     domain_objs = set()
@@ -35,7 +38,7 @@ def get_domain_objects():
     return domain_objs
 
 
-@utils.time_stats('Update Geom Object')
+@profiler.profile('Update geom object')
 def update_geom_object(mode):
     domains = get_domain_objects()
     for domain in domains:
@@ -61,28 +64,28 @@ def update_par_object(self, context):
     update_geom_object('PART')
 
 
-@utils.time_stats('Get File Path')
+def update_memory_cache(self, context):
+    memory = frame_cache.get_cache(self.id_data.name)
+    memory.set_budget(self.memory_cache_size)
+
+
 def get_file_path(domain, mode, frame=None):
-    cache_folder = bpy.path.abspath(domain.jet_fluid.cache_folder)
+    cache_folder = bake.get_cache_folder(domain.jet_fluid)
     if frame is None:
         frame = bpy.context.scene.frame_current
-    if mode == 'POS':
-        base_name = 'pos'
-    elif mode == 'VEL':
-        base_name = 'vel'
-    elif mode == 'FORCE':
-        base_name = 'force'
+    if mode == 'PAR':
+        base_name = 'particles'
     elif mode == 'COL':
         base_name = 'col'
     elif mode == 'VERT':
         base_name = 'vert'
     elif mode == 'TRIS':
         base_name = 'tris'
-    file_path = '{0}{1}_{2:0>6}.bin'.format(cache_folder, base_name, frame)
+    file_path = cache.get_frame_path(cache_folder, base_name, frame)
     return file_path
 
 
-@utils.time_stats('Create Geom Object')
+@profiler.profile('Create geom object')
 def create_geom_object(domain, base_name, attr_name):
     mesh = bpy.data.meshes.new('jet_fluid_' + base_name)
     obj = bpy.data.objects.new('jet_fluid_' + base_name, mesh)
@@ -91,7 +94,11 @@ def create_geom_object(domain, base_name, attr_name):
     return obj
 
 
-@utils.time_stats('Get Array')
+def swap_array(array):
+    return array[:, (0, 2, 1)]
+
+
+@profiler.profile('Get array')
 def get_array(file_path, array_type, swap=False):
     if not os.path.exists(file_path):
         return
@@ -99,58 +106,52 @@ def get_array(file_path, array_type, swap=False):
         data_type = numpy.float32
     elif array_type == 'INT':
         data_type = numpy.int32
-    array = numpy.fromfile(file_path, dtype=data_type)
-    array.shape = (array.shape[0] // 3, 3)
+    array = cache.map_array(file_path, data_type, 3)
     if swap:
-        swaped = []
-        for element in array:
-            swaped.append((element[0], element[2], element[1]))
-        array = swaped
+        array = swap_array(array)
     return array
 
 
-@utils.time_stats('Write Array')
-def write_array(array, file_path, array_type, swap=True, offset=None):
-    if array_type == 'FLOAT':
-        data_type = numpy.float32
-    elif array_type == 'INT':
-        data_type = numpy.int32
+@profiler.profile('Get channel')
+def get_channel(file_path, channel, swap=False):
+    array = cache.read_channel(file_path, channel)
+    if array is None:
+        return
     if swap:
-        swaped = []
-        for element in array:
-            swaped.append((element[0], element[2], element[1]))
-        array = swaped
-    if offset:
-        offset_array = []
-        for element in array:
-            offset_array.append((
-                element[0] - offset[0],
-                element[1] - offset[1],
-                element[2] - offset[2]
-            ))
-        array = offset_array
-    np_array = numpy.array(array, data_type)
-    np_array.tofile(file_path)
-
-
-@utils.time_stats('Get Geom Object')
-def get_geom_object(domain, attr_name, base_name, verts_count):
+        array = swap_array(array)
+    return array
+
+
+def load_positions(file_path):
+    return get_channel(file_path, 'pos')
+
+
+def load_vertices(file_path):
+    return get_array(file_path, 'FLOAT')
+
+
+def load_triangles(file_path):
+    return get_array(file_path, 'INT')
+
+
+def get_cached_array(domain, channel, frame, file_path, load):
+    memory = frame_cache.get_cache(domain.name)
+    memory.set_budget(domain.jet_fluid.memory_cache_size)
+    return memory.get((channel, frame), file_path, load)
+
+
+@profiler.profile('Get geom object')
+def get_geom_object(domain, attr_name, base_name):
     attr_value = getattr(domain.jet_fluid, attr_name)
-    is_clear = False
-    if not attr_value:
-        obj = create_geom_object(domain, base_name, attr_name)
-    else:
+    obj = None
+    if attr_value:
         obj = bpy.data.objects.get(attr_value)
-        if obj:
-            if verts_count != len(obj.data.vertices):
-                obj.data.clear_geometry()
-                is_clear = True
-        else:
-            obj = create_geom_object(domain, base_name, attr_name)
-    return obj, is_clear
+    if obj is None:
+        obj = create_geom_object(domain, base_name, attr_name)
+    return obj
 
 
-@utils.time_stats('Set Mesh Location')
+@profiler.profile('Set mesh location')
 def set_mesh_location(domain, obj):
     obj.location = (
         domain.bound_box[0][0] * domain.scale[0] + domain.location[0],
@@ -159,68 +160,124 @@ def set_mesh_location(domain, obj):
     )
 
 
-@utils.time_stats('Set Par Location')
+@profiler.profile('Set par location')
 def set_par_location(domain, obj):
     obj.location = domain.location
 
 
-@utils.time_stats('Create Particles')
+@profiler.profile('Set particles geometry')
+def set_particles_geometry(mesh, vertices):
+    # allocations are reused, when the count is unchanged
+    if len(mesh.vertices) != len(vertices):
+        mesh.clear_geometry()
+        mesh.vertices.add(len(vertices))
+    mesh.vertices.foreach_set('co', vertices.reshape(-1))
+    mesh.update()
+
+
+@profiler.profile('Create particles')
 def create_particles(domain):
-    file_path = get_file_path(domain, 'POS')
-    vertices = get_array(file_path, 'FLOAT')
+    frame = bpy.context.scene.frame_current
+    file_path = get_file_path(domain, 'PAR', frame)
+    vertices = get_cached_array(domain, 'pos', frame, file_path, load_positions)
 
     if vertices is None:
         clear_fluid_geometry(domain, 'PART')
         return
 
-    par_object, is_clear = get_geom_object(
-        domain,
-        'particles_object',
-        'particles',
-        len(vertices)
-    )
-
-    if is_clear:
-        par_object.data.from_pydata(vertices, (), ())
-    else:
-        vertices.shape = (vertices.shape[0] * 3)
-        par_object.data.vertices.foreach_set('co', vertices)
-        par_object.data.update()
-
+    par_object = get_geom_object(domain, 'particles_object', 'particles')
+    set_particles_geometry(par_object.data, vertices)
     set_par_location(domain, par_object)
 
 
-@utils.time_stats('Create Mesh')
+@profiler.profile('Set mesh geometry')
+def set_mesh_geometry(mesh, vertices, triangles):
+    verts_count = len(vertices)
+    tris_count = len(triangles)
+    # allocations are reused, when the sizes are unchanged
+    if len(mesh.vertices) != verts_count or len(mesh.polygons) != tris_count:
+        mesh.clear_geometry()
+        mesh.vertices.add(verts_count)
+        mesh.loops.add(tris_count * 3)
+        mesh.polygons.add(tris_count)
+        loop_start = numpy.arange(0, tris_count * 3, 3, dtype=numpy.int32)
+        mesh.polygons.foreach_set('loop_start', loop_start)
+        mesh.polygons.foreach_set('loop_total', numpy.full(tris_count, 3, numpy.int32))
+        mesh.polygons.foreach_set('use_smooth', numpy.ones(tris_count, numpy.bool_))
+    mesh.vertices.foreach_set('co', vertices.reshape(-1))
+    mesh.loops.foreach_set('vertex_index', triangles.reshape(-1))
+    mesh.update(calc_edges=True)
+
+
+@profiler.profile('Create mesh')
 def create_mesh(domain):
-    vert_file = get_file_path(domain, 'VERT')
-    vertices = get_array(vert_file, 'FLOAT')
+    frame = bpy.context.scene.frame_current
+    vert_file = get_file_path(domain, 'VERT', frame)
+    vertices = get_cached_array(domain, 'vert', frame, vert_file, load_vertices)
 
-    tris_file = get_file_path(domain, 'TRIS')
-    triangles = get_array(tris_file, 'INT')
+    tris_file = get_file_path(domain, 'TRIS', frame)
+    triangles = get_cached_array(domain, 'tris', frame, tris_file, load_triangles)
 
     if vertices is None or triangles is None:
         clear_fluid_geometry(domain, 'MESH')
         return
 
-    mesh_object, _ = get_geom_object(domain, 'mesh_object', 'mesh', -1)
-    mesh_object.data.from_pydata(vertices, (), triangles)
+    mesh_object = get_geom_object(domain, 'mesh_object', 'mesh')
+    set_mesh_geometry(mesh_object.data, vertices, triangles)
+    set_mesh_location(domain, mesh_object)
 
-    for polygon in mesh_object.data.polygons:
-        polygon.use_smooth = True
 
-    set_mesh_location(domain, mesh_object)
+def get_prefetch_jobs(domain, frame):
+    memory = frame_cache.get_cache(domain.name)
+    jobs = []
+    if domain.jet_fluid.create_particles:
+        file_path = get_file_path(domain, 'PAR', frame)
+        jobs.append((memory, ('pos', frame), file_path, load_positions))
+    if domain.jet_fluid.create_mesh:
+        file_path = get_file_path(domain, 'VERT', frame)
+        jobs.append((memory, ('vert', frame), file_path, load_vertices))
+        file_path = get_file_path(domain, 'TRIS', frame)
+        jobs.append((memory, ('tris', frame), file_path, load_triangles))
+    return jobs
+
+
+def prefetch_geometry(domains, frame):
+    domains = [
+        domain for domain in domains
+        if domain.jet_fluid.memory_cache_size and domain.jet_fluid.prefetch_frames
+    ]
+    depth = max((domain.jet_fluid.prefetch_frames for domain in domains), default=0)
+
+    def get_jobs(prefetch_frame, index):
+        jobs = []
+        for domain in domains:
+            if index <= domain.jet_fluid.prefetch_frames:
+                jobs.extend(get_prefetch_jobs(domain, prefetch_frame))
+        return jobs
+
+    frame_cache.prefetcher.update(frame, depth, get_jobs)
 
 
 @bpy.app.handlers.persistent
 def import_geometry(scene):
-    print('-' * 79)
     domains = get_domain_objects()
-    for domain in domains:
-        if domain.jet_fluid.create_particles:
-            create_particles(domain)
-        if domain.jet_fluid.create_mesh:
-            create_mesh(domain)
-    print('-' * 79)
+    # frames, that are changed by the bake operators, are profiled by them
+    profiling = not profiler.profiler.enabled and any(
+        domain.jet_fluid.profiling for domain in domains
+    )
+    if profiling:
+        profiler.start(True)
+    try:
+        with profiler.scope('Import geometry'):
+            for domain in domains:
+                if domain.jet_fluid.create_particles:
+                    create_particles(domain)
+                if domain.jet_fluid.create_mesh:
+                    create_mesh(domain)
+            prefetch_geometry(domains, scene.frame_current)
+    finally:
+        if profiling:
+            profiler.finish('IMPORT')
 
 
 def register():
@@ -228,4 +285,5 @@ def register():
 
 
 def unregister():
+    frame_cache.prefetcher.cancel()
     bpy.app.handlers.frame_change_pre.remove(import_geometry)
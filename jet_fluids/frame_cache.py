@@ -0,0 +1,156 @@
+import os
+import threading
+import collections
+
+import numpy
+
+
+MEGABYTE = 1024 * 1024
+
+
+class FrameCache:
+    def __init__(self):
+        self.frames = collections.OrderedDict()
+        self.size = 0
+        self.budget = 0
+        self.hits = 0
+        self.misses = 0
+        self.loading = {}
+        self.lock = threading.RLock()
+
+    def get(self, key, file_path, load):
+        return self.fetch(key, file_path, load, stats=True)
+
+    def prefetch(self, key, file_path, load):
+        self.fetch(key, file_path, load, stats=False)
+
+    def fetch(self, key, file_path, load, stats):
+        # key is (channel, frame), entries are invalidated by file changes
+        if not self.budget:
+            return load(file_path)
+        try:
+            stat = os.stat(file_path)
+        except OSError:
+            self.remove(key)
+            return
+        signature = (stat.st_mtime_ns, stat.st_size)
+        while True:
+            with self.lock:
+                entry = self.frames.get(key)
+                if entry is not None and entry[0] == signature:
+                    self.frames.move_to_end(key)
+                    if stats:
+                        self.hits += 1
+                    return entry[1]
+                event = self.loading.get(key)
+                if event is None:
+                    event = threading.Event()
+                    self.loading[key] = event
+                    if stats:
+                        self.misses += 1
+                    break
+            # the frame is being loaded by another thread
+            event.wait()
+        try:
+            array = load(file_path)
+            if array is not None:
+                # copy mapped arrays, so that cached frames do not keep files open
+                array = numpy.array(array)
+                self.put(key, signature, array)
+        finally:
+            with self.lock:
+                del self.loading[key]
+            event.set()
+        return array
+
+    def put(self, key, signature, array):
+        with self.lock:
+            self.remove(key)
+            if array.nbytes > self.budget:
+                return
+            self.frames[key] = (signature, array)
+            self.size += array.nbytes
+            self.trim()
+
+    def remove(self, key):
+        with self.lock:
+            entry = self.frames.pop(key, None)
+            if entry is not None:
+                self.size -= entry[1].nbytes
+
+    def trim(self):
+        with self.lock:
+            while self.size > self.budget:
+                _, (_, array) = self.frames.popitem(last=False)
+                self.size -= array.nbytes
+
+    def set_budget(self, megabytes):
+        self.budget = int(megabytes * MEGABYTE)
+        self.trim()
+
+    def clear(self):
+        with self.lock:
+            self.frames.clear()
+            self.size = 0
+            self.hits = 0
+            self.misses = 0
+
+
+class Prefetcher:
+    def __init__(self):
+        self.jobs = collections.deque()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.last_frame = None
+
+    def update(self, frame, depth, get_jobs):
+        # get_jobs(frame, index) returns (cache, key, file_path, load)
+        # tuples of the index-th prefetched frame, it is called here,
+        # in the main thread
+        if self.last_frame is None:
+            step = 0
+        else:
+            step = frame - self.last_frame
+        self.last_frame = frame
+        jobs = []
+        # playback drops frames, when the loading is slow, so steps up to
+        # the depth are playback and the frames are prefetched along
+        # the step, larger jumps cancel pending jobs
+        if step and abs(step) <= depth:
+            for index in range(1, depth + 1):
+                jobs.extend(get_jobs(frame + index * step, index))
+        with self.condition:
+            self.jobs.clear()
+            self.jobs.extend(jobs)
+            self.condition.notify()
+        if jobs and self.thread is None:
+            self.thread = threading.Thread(target=self.run, daemon=True)
+            self.thread.start()
+
+    def cancel(self):
+        with self.condition:
+            self.jobs.clear()
+        self.last_frame = None
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.jobs:
+                    self.condition.wait()
+                cache, key, file_path, load = self.jobs.popleft()
+            try:
+                cache.prefetch(key, file_path, load)
+            except Exception as error:
+                print('Prefetch error: "{0}": {1}'.format(file_path, error))
+
+
+caches = {}
+prefetcher = Prefetcher()
+
+
+def get_cache(domain_name):
+    cache = caches.get(domain_name)
+    if cache is None:
+        cache = FrameCache()
+        caches[domain_name] = cache
+    return cache
@@ -0,0 +1,185 @@
+import os
+import sys
+import json
+import threading
+import contextlib
+
+
+# index of the cache folder, one entry per written frame and stage:
+#     {"version": 1, "stages": {"particles": {"1": {...}}, "mesh": {...}}}
+# frame queries do not list or stat the cache files. several processes
+# can bake into one folder, their entries are merged into the file
+MANIFEST_FILE = 'manifest.json'
+LOCK_FILE = 'manifest.lock'
+VERSION = 1
+PARTICLES = 'particles'
+MESH = 'mesh'
+
+
+@contextlib.contextmanager
+def locked_file(file_path):
+    # exclusive lock between the processes
+    with open(file_path, 'a+b') as file:
+        if sys.platform == 'win32':
+            import msvcrt
+            file.seek(0)
+            while True:
+                try:
+                    # retries for 10 seconds, then raises
+                    msvcrt.locking(file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+            try:
+                yield
+            finally:
+                file.seek(0)
+                msvcrt.locking(file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(file.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(file.fileno(), fcntl.LOCK_UN)
+
+
+class Manifest:
+    def __init__(self, cache_folder):
+        self.file_path = os.path.join(cache_folder, MANIFEST_FILE)
+        self.lock_path = os.path.join(cache_folder, LOCK_FILE)
+        self.lock = threading.RLock()
+        self.signature = None
+        self.stages = {}
+        # entries and cleared stages of this process, that are not saved yet
+        self.changes = {}
+        self.cleared = set()
+        self.load()
+
+    def get_signature(self):
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def read(self):
+        try:
+            with open(self.file_path) as file:
+                data = json.load(file)
+        except FileNotFoundError:
+            return {}
+        except ValueError as error:
+            print('Invalid cache manifest "{0}": {1}'.format(self.file_path, error))
+            return {}
+        if data.get('version', VERSION) != VERSION:
+            print('Unsupported cache manifest version: {}'.format(data['version']))
+            return {}
+        return data.get('stages', {})
+
+    def merge(self, stages):
+        # changes of this process over the entries of the file
+        for stage in self.cleared:
+            stages.pop(stage, None)
+        for stage, entries in self.changes.items():
+            stages.setdefault(stage, {}).update(entries)
+        return stages
+
+    def load(self):
+        with self.lock:
+            signature = self.get_signature()
+            if signature is None:
+                self.stages = self.merge({})
+            elif signature != self.signature:
+                self.stages = self.merge(self.read())
+            self.signature = signature
+
+    def save(self):
+        # the file is read again under the lock, so that the entries
+        # of the other processes are kept
+        with self.lock:
+            folder = os.path.dirname(self.file_path)
+            if not os.path.exists(folder):
+                os.makedirs(folder)
+            with locked_file(self.lock_path):
+                stages = self.merge(self.read())
+                temp_path = self.file_path + '.tmp'
+                with open(temp_path, 'w') as file:
+                    json.dump({'version': VERSION, 'stages': stages}, file, sort_keys=True)
+                os.replace(temp_path, self.file_path)
+                self.signature = self.get_signature()
+            self.stages = stages
+            self.changes = {}
+            self.cleared = set()
+
+    def reload(self):
+        # picks up changes of other processes
+        with self.lock:
+            if self.get_signature() != self.signature:
+                self.load()
+
+    def get(self, stage, frame):
+        with self.lock:
+            return self.stages.get(stage, {}).get(str(frame))
+
+    def update(self, stage, frame, entry, save=True):
+        with self.lock:
+            self.stages.setdefault(stage, {})[str(frame)] = entry
+            self.changes.setdefault(stage, {})[str(frame)] = entry
+            if save:
+                self.save()
+
+    def clear(self, stage):
+        with self.lock:
+            self.stages.pop(stage, None)
+            self.changes.pop(stage, None)
+            self.cleared.add(stage)
+            self.save()
+
+    def get_frames(self, stage):
+        with self.lock:
+            return sorted(map(int, self.stages.get(stage, {})))
+
+    def get_missing_frames(self, stage, frame_start, frame_end):
+        with self.lock:
+            entries = self.stages.get(stage, {})
+            return [
+                frame for frame in range(frame_start, frame_end + 1)
+                if str(frame) not in entries
+            ]
+
+    def get_total_size(self, stage):
+        with self.lock:
+            return sum(
+                entry.get('size', 0)
+                for entry in self.stages.get(stage, {}).values()
+            )
+
+    def get_curve(self, stage, key):
+        # {frame: value}, for example particles count per frame
+        with self.lock:
+            return {
+                int(frame): entry[key]
+                for frame, entry in self.stages.get(stage, {}).items()
+                if key in entry
+            }
+
+
+manifests = {}
+manifests_lock = threading.Lock()
+
+
+def get_manifest(cache_folder):
+    with manifests_lock:
+        manifest = manifests.get(cache_folder)
+        if manifest is None:
+            manifest = Manifest(cache_folder)
+            manifests[cache_folder] = manifest
+    manifest.reload()
+    return manifest
+
+
+def get_bounds(array):
+    if not len(array):
+        return
+    return [array.min(axis=0).tolist(), array.max(axis=0).tolist()]
@@ -0,0 +1,665 @@
+import os
+import sys
+import json
+import math
+import time
+import zlib
+import hashlib
+import itertools
+import contextlib
+import multiprocessing
+import concurrent.futures
+
+import numpy
+
+from . import pyjet
+from . import cache
+from . import manifest
+from . import profiler
+from . import converters
+
+
+MEGABYTE = 1024 * 1024
+HASH_CHUNK_SIZE = 4 * MEGABYTE
+
+# settings and converter of the worker process
+worker_data = {}
+# windows job object limits
+JOB_OBJECT_LIMIT_PROCESS_MEMORY = 0x00000100
+JOB_OBJECT_EXTENDED_LIMIT_INFORMATION = 9
+# numpy converters and the pyjet converters with the same fields
+NUMPY_CONVERTERS = {
+    'NUMPYSPHERICALPOINTSTOIMPLICIT': 'SPHERICALPOINTSTOIMPLICIT',
+    'NUMPYZHUBRIDSONPOINTSTOIMPLICIT': 'ZHUBRIDSONPOINTSTOIMPLICIT'
+}
+# profiler scopes of the frame, timed in the workers
+MESH_PHASES = (
+    ('Read particles', 'read_time'),
+    ('Convert', 'convert_time'),
+    ('Marching cubes', 'mesh_time'),
+    ('Save mesh', 'save_time')
+)
+
+
+def print_mesh_info(*print_params):
+    print(*print_params)
+
+
+def create_grid(settings):
+    return pyjet.VertexCenteredScalarGrid3(
+        resolution=settings['resolution'],
+        gridOrigin=settings['origin'],
+        domainSizeX=settings['domain_size_x']
+    )
+
+
+def create_converter(settings):
+    converter_type = settings['converter_type']
+    kernel_radius = settings['kernel_radius'] * settings['grid_spacing']
+    radius = settings['radius'] * settings['grid_spacing']
+    if converter_type == 'ANISOTROPICPOINTSTOIMPLICIT':
+        converter = pyjet.AnisotropicPointsToImplicit3(
+            kernel_radius,
+            settings['cut_off_density'],
+            settings['position_smoothing_factor'],
+            settings['min_num_neighbors'],
+            settings['is_output_sdf']
+        )
+    elif converter_type == 'SPHPOINTSTOIMPLICIT':
+        converter = pyjet.SphPointsToImplicit3(
+            kernel_radius,
+            settings['cut_off_density'],
+            settings['is_output_sdf']
+        )
+    elif converter_type == 'SPHERICALPOINTSTOIMPLICIT':
+        converter = pyjet.SphericalPointsToImplicit3(
+            radius,
+            settings['is_output_sdf']
+        )
+    elif converter_type == 'ZHUBRIDSONPOINTSTOIMPLICIT':
+        converter = pyjet.ZhuBridsonPointsToImplicit3(
+            kernel_radius,
+            settings['cut_off_threshold'],
+            settings['is_output_sdf']
+        )
+    elif converter_type == 'NUMPYSPHERICALPOINTSTOIMPLICIT':
+        converter = converters.SphericalPointsToImplicit(radius)
+    elif converter_type == 'NUMPYZHUBRIDSONPOINTSTOIMPLICIT':
+        converter = converters.ZhuBridsonPointsToImplicit(
+            kernel_radius,
+            settings['cut_off_threshold']
+        )
+    return converter
+
+
+def convert_points(converter, points, grid, origin, spacing):
+    if isinstance(converter, converters.CONVERTERS):
+        # numpy converters write into the grid buffer
+        converter.convert(points, numpy.asarray(grid.dataAccessor()), origin, spacing)
+    else:
+        converter.convert(points.tolist(), grid)
+
+
+def read_particles(settings, frame_index):
+    file_path = cache.get_frame_path(settings['cache_folder'], 'particles', frame_index)
+    if not os.path.exists(file_path):
+        print_mesh_info('Can\'t find particles file in {} frame'.format(frame_index))
+        return
+    points = cache.read_channel(file_path, 'pos')[:, (0, 2, 1)]
+    location = settings['location']
+    points += (location[0], location[2], location[1])
+    return points
+
+
+def get_bulk_array(surface_mesh, attr_name, count):
+    # bulk accessor with the buffer protocol, when pyjet provides it
+    try:
+        array = numpy.asarray(getattr(surface_mesh, attr_name))
+    except (AttributeError, TypeError, ValueError):
+        return
+    if array.shape != (count, 3) or array.dtype == object:
+        return
+    return array
+
+
+def get_mesh_arrays(surface_mesh):
+    points_count = surface_mesh.numberOfPoints()
+    triangles_count = surface_mesh.numberOfTriangles()
+    points = get_bulk_array(surface_mesh, 'points', points_count)
+    if points is None:
+        points = numpy.fromiter(
+            itertools.chain.from_iterable(
+                (point.x, point.y, point.z)
+                for point in map(surface_mesh.point, range(points_count))
+            ),
+            dtype=numpy.float64,
+            count=points_count * 3
+        ).reshape(points_count, 3)
+    triangles = get_bulk_array(surface_mesh, 'pointIndices', triangles_count)
+    if triangles is None:
+        triangles = numpy.fromiter(
+            itertools.chain.from_iterable(
+                (tris.x, tris.y, tris.z)
+                for tris in map(surface_mesh.pointIndex, range(triangles_count))
+            ),
+            dtype=numpy.int64,
+            count=triangles_count * 3
+        ).reshape(triangles_count, 3)
+    return points, triangles
+
+
+def save_mesh(settings, points, triangles, frame_index):
+    start_time = time.time()
+    vertices = cache.convert_array(points, numpy.float32)
+    vertices *= settings['scale_coefficient']
+    verts_file_path = cache.get_frame_path(settings['cache_folder'], 'vert', frame_index)
+    vertices.tofile(verts_file_path)
+
+    faces = cache.convert_array(triangles, numpy.int32)
+    faces_file_path = cache.get_frame_path(settings['cache_folder'], 'tris', frame_index)
+    faces.tofile(faces_file_path)
+
+    return {
+        'vertices': len(vertices),
+        'triangles': len(faces),
+        'bounds': manifest.get_bounds(vertices),
+        'size': vertices.nbytes + faces.nbytes,
+        'checksum': '{:08x}'.format(zlib.crc32(faces, zlib.crc32(vertices))),
+        'save_time': time.time() - start_time
+    }
+
+
+def get_mesh_spacing(settings):
+    return settings['domain_size_x'] / settings['resolution'][0]
+
+
+def get_support(settings):
+    # distance from the particles, where the converters change the grid
+    kernel_radius = settings['kernel_radius'] * settings['grid_spacing']
+    converter_type = NUMPY_CONVERTERS.get(settings['converter_type'], settings['converter_type'])
+    if converter_type == 'SPHERICALPOINTSTOIMPLICIT':
+        return settings['radius'] * settings['grid_spacing']
+    elif converter_type == 'ANISOTROPICPOINTSTOIMPLICIT':
+        # kernels are stretched along the surface
+        return 2.0 * kernel_radius
+    return kernel_radius
+
+
+def get_boundary_flags(settings, box_min, box_max):
+    # domain flags are used for the sides of the box on the domain boundary,
+    # inner sides are open and the vertices are welded after meshing
+    resolution = settings['resolution']
+    sides = (
+        (box_min[0] == 0, pyjet.DIRECTION_LEFT),
+        (box_max[0] == resolution[0], pyjet.DIRECTION_RIGHT),
+        (box_min[1] == 0, pyjet.DIRECTION_DOWN),
+        (box_max[1] == resolution[1], pyjet.DIRECTION_UP),
+        (box_min[2] == 0, pyjet.DIRECTION_BACK),
+        (box_max[2] == resolution[2], pyjet.DIRECTION_FRONT)
+    )
+    close_flag = 0
+    connectivity_flag = 0
+    for on_boundary, direction in sides:
+        if on_boundary:
+            close_flag |= settings['close_flag'] & direction
+            connectivity_flag |= settings['connectivity_flag'] & direction
+        else:
+            connectivity_flag |= direction
+    return close_flag, connectivity_flag
+
+
+def set_far_values(settings, grid):
+    # zhu bridson gives the nodes without particles the diagonal of the grid,
+    # the one of the domain grid is used in the boxes, so that the surface
+    # near these nodes crosses the cells as in the whole grid. the other
+    # nodes are closer than the kernel radius to the particles average
+    converter_type = settings['converter_type']
+    if NUMPY_CONVERTERS.get(converter_type, converter_type) != 'ZHUBRIDSONPOINTSTOIMPLICIT':
+        return
+    if converter_type in NUMPY_CONVERTERS or not settings['is_output_sdf']:
+        values = numpy.asarray(grid.dataAccessor())
+        size = numpy.array(settings['resolution'], dtype=numpy.float64) * get_mesh_spacing(settings)
+        values[values >= settings['kernel_radius'] * settings['grid_spacing']] = numpy.linalg.norm(size)
+
+
+def mesh_box(settings, converter, points, box_min, box_max, result):
+    # meshes the cells box_min - box_max of the domain grid, the vertices
+    # are in the same space as the vertices of the whole grid
+    spacing = get_mesh_spacing(settings)
+    resolution = [int(high - low) for low, high in zip(box_min, box_max)]
+    grid_origin = [origin + index * spacing for origin, index in zip(settings['origin'], box_min)]
+    grid = pyjet.VertexCenteredScalarGrid3(
+        resolution=resolution,
+        gridOrigin=grid_origin,
+        domainSizeX=resolution[0] * spacing
+    )
+    phase_start = time.time()
+    convert_points(converter, points, grid, grid_origin, spacing)
+    set_far_values(settings, grid)
+    result['convert_time'] = result.get('convert_time', 0.0) + time.time() - phase_start
+    phase_start = time.time()
+    close_flag, connectivity_flag = get_boundary_flags(settings, box_min, box_max)
+    mesh_spacing = settings['grid_spacing']
+    surface_mesh = pyjet.marchingCubes(
+        grid,    # grid
+        (mesh_spacing, mesh_spacing, mesh_spacing),    # gridSize
+        tuple(float(index) * mesh_spacing for index in box_min),    # origin
+        settings['iso_value'],    # isoValue
+        close_flag,    # bndClose
+        connectivity_flag    # bndConnectivity
+    )
+    arrays = get_mesh_arrays(surface_mesh)
+    result['mesh_time'] = result.get('mesh_time', 0.0) + time.time() - phase_start
+    return arrays
+
+
+def get_active_tiles(settings, bounds_min, bounds_max, tile_size):
+    # tiles, that have cells closer to the particles than the converter
+    # support, bounds are the particles boxes of the occupied tiles
+    # in the cells units
+    resolution = numpy.array(settings['resolution'])
+    tiles_count = -(-resolution // tile_size)
+    reach = get_support(settings) / get_mesh_spacing(settings) + 1.0
+    tiles_min = numpy.clip(numpy.floor((bounds_min - reach) / tile_size), 0, tiles_count - 1).astype(numpy.int64)
+    tiles_max = numpy.clip(numpy.floor((bounds_max + reach) / tile_size), 0, tiles_count - 1).astype(numpy.int64)
+    spread = int((tiles_max - tiles_min).max())
+    active = []
+    for offset in itertools.product(range(spread + 1), repeat=3):
+        tiles = tiles_min + offset
+        active.append(tiles[(tiles <= tiles_max).all(axis=1)])
+    return numpy.unique(numpy.concatenate(active), axis=0)
+
+
+def weld_vertices(points, triangles, tolerance):
+    # vertices on the sides of the neighbouring tiles are shared
+    keys = numpy.round(points / tolerance).astype(numpy.int64)
+    _, index, inverse = numpy.unique(keys, axis=0, return_index=True, return_inverse=True)
+    return points[index], inverse.reshape(-1)[triangles]
+
+
+def mesh_sparse(settings, converter, points, result):
+    # only the tiles near the particles are allocated and meshed
+    tile_size = settings['mesh_tile_size']
+    spacing = get_mesh_spacing(settings)
+    resolution = numpy.array(settings['resolution'])
+    coords = (points - settings['origin']) / spacing
+    # neighbours of the particles near the tile change the grid values too
+    margin = 2.0 * get_support(settings) / spacing
+    tiles_count = -(-resolution // tile_size)
+    particle_tiles = numpy.clip(numpy.floor(coords / tile_size), 0, tiles_count - 1).astype(numpy.int64)
+    keys = numpy.ravel_multi_index(particle_tiles.T, tiles_count)
+    order = numpy.argsort(keys, kind='stable')
+    bins, starts, counts = numpy.unique(keys[order], return_index=True, return_counts=True)
+    sorted_coords = coords[order]
+    tiles = get_active_tiles(
+        settings,
+        numpy.minimum.reduceat(sorted_coords, starts, axis=0),
+        numpy.maximum.reduceat(sorted_coords, starts, axis=0),
+        tile_size
+    )
+    del sorted_coords
+    bins = dict(zip(bins.tolist(), zip(starts.tolist(), counts.tolist())))
+    reach = int(math.ceil(margin / tile_size))
+    points_list = []
+    triangles_list = []
+    vertices_count = 0
+    for tile in tiles:
+        box_min = tile * tile_size
+        box_max = numpy.minimum(box_min + tile_size, resolution)
+        indices = []
+        for offset in itertools.product(range(-reach, reach + 1), repeat=3):
+            neighbour = tile + offset
+            if (neighbour < 0).any() or (neighbour >= tiles_count).any():
+                continue
+            entry = bins.get(int(numpy.ravel_multi_index(neighbour, tiles_count)))
+            if entry:
+                indices.append(order[entry[0] : entry[0] + entry[1]])
+        if not indices:
+            continue
+        indices = numpy.concatenate(indices)
+        tile_coords = coords[indices]
+        inside = (
+            (tile_coords >= box_min - margin) & (tile_coords <= box_max + margin)
+        ).all(axis=1)
+        tile_points, tile_triangles = mesh_box(
+            settings,
+            converter,
+            points[indices[inside]],
+            box_min,
+            box_max,
+            result
+        )
+        if len(tile_triangles):
+            points_list.append(tile_points)
+            triangles_list.append(tile_triangles + vertices_count)
+            vertices_count += len(tile_points)
+    result['tiles'] = len(tiles)
+    if not points_list:
+        return numpy.empty((0, 3)), numpy.empty((0, 3), dtype=numpy.int64)
+    return weld_vertices(
+        numpy.concatenate(points_list),
+        numpy.concatenate(triangles_list),
+        settings['grid_spacing'] * 1e-5
+    )
+
+
+def get_particles_box(settings, coords):
+    # cells box of the particles with the converter support, snapped
+    # to the domain grid, coords are the particles in the cells units
+    resolution = numpy.array(settings['resolution'])
+    reach = get_support(settings) / get_mesh_spacing(settings) + 1.0
+    box_min = numpy.clip(numpy.floor(coords.min(axis=0) - reach), 0, resolution)
+    box_max = numpy.clip(numpy.ceil(coords.max(axis=0) + reach), 0, resolution)
+    return box_min.astype(numpy.int64), box_max.astype(numpy.int64)
+
+
+def mesh_grid(settings, grid, converter, points, result):
+    # the whole domain grid
+    phase_start = time.time()
+    convert_points(converter, points, grid, settings['origin'], get_mesh_spacing(settings))
+    result['convert_time'] = time.time() - phase_start
+    phase_start = time.time()
+    spacing = settings['grid_spacing']
+    surface_mesh = pyjet.marchingCubes(
+        grid,    # grid
+        (spacing, spacing, spacing),    # gridSize
+        (0, 0, 0),    # origin
+        settings['iso_value'],    # isoValue
+        settings['close_flag'],    # bndClose
+        settings['connectivity_flag']    # bndConnectivity
+    )
+    arrays = get_mesh_arrays(surface_mesh)
+    result['mesh_time'] = time.time() - phase_start
+    return arrays
+
+
+def mesh_cropped(settings, converter, points, result):
+    # the domain grid is allocated, only when the particles fill it
+    coords = (points - settings['origin']) / get_mesh_spacing(settings)
+    box_min, box_max = get_particles_box(settings, coords)
+    resolution = numpy.array(settings['resolution'])
+    result['cells'] = int(numpy.prod(box_max - box_min))
+    if (box_max <= box_min).any():
+        # all particles are outside of the domain
+        return numpy.empty((0, 3)), numpy.empty((0, 3), dtype=numpy.int64)
+    if not box_min.any() and (box_max == resolution).all():
+        return mesh_grid(settings, create_grid(settings), converter, points, result)
+    return mesh_box(settings, converter, points, box_min, box_max, result)
+
+
+def mesh_frame(settings, converter, frame_index):
+    start_time = time.time()
+    result = {
+        'frame': frame_index,
+        'particles': 0,
+        'vertices': 0,
+        'triangles': 0
+    }
+    points = read_particles(settings, frame_index)
+    result['read_time'] = time.time() - start_time
+    if points is not None and len(points):
+        result['particles'] = len(points)
+        if settings['mesh_sparse_grid']:
+            vertices, triangles = mesh_sparse(settings, converter, points, result)
+        else:
+            vertices, triangles = mesh_cropped(settings, converter, points, result)
+        result.update(save_mesh(settings, vertices, triangles, frame_index))
+    result['time'] = time.time() - start_time
+    return result
+
+
+def set_job_memory_limit(limit):
+    # windows: the process is assigned to a job object with the limit of
+    # the committed memory, the job handle is kept open for the process life
+    import ctypes
+
+    class BasicLimitInformation(ctypes.Structure):
+        _fields_ = [
+            ('PerProcessUserTimeLimit', ctypes.c_int64),
+            ('PerJobUserTimeLimit', ctypes.c_int64),
+            ('LimitFlags', ctypes.c_uint32),
+            ('MinimumWorkingSetSize', ctypes.c_size_t),
+            ('MaximumWorkingSetSize', ctypes.c_size_t),
+            ('ActiveProcessLimit', ctypes.c_uint32),
+            ('Affinity', ctypes.c_size_t),
+            ('PriorityClass', ctypes.c_uint32),
+            ('SchedulingClass', ctypes.c_uint32)
+        ]
+
+    class ExtendedLimitInformation(ctypes.Structure):
+        _fields_ = [
+            ('BasicLimitInformation', BasicLimitInformation),
+            ('IoInfo', ctypes.c_uint64 * 6),
+            ('ProcessMemoryLimit', ctypes.c_size_t),
+            ('JobMemoryLimit', ctypes.c_size_t),
+            ('PeakProcessMemoryUsed', ctypes.c_size_t),
+            ('PeakJobMemoryUsed', ctypes.c_size_t)
+        ]
+
+    kernel32 = ctypes.windll.kernel32
+    kernel32.CreateJobObjectW.restype = ctypes.c_void_p
+    kernel32.GetCurrentProcess.restype = ctypes.c_void_p
+    job = kernel32.CreateJobObjectW(None, None)
+    if not job:
+        return False
+    info = ExtendedLimitInformation()
+    info.BasicLimitInformation.LimitFlags = JOB_OBJECT_LIMIT_PROCESS_MEMORY
+    info.ProcessMemoryLimit = limit
+    success = (
+        kernel32.SetInformationJobObject(
+            ctypes.c_void_p(job),
+            JOB_OBJECT_EXTENDED_LIMIT_INFORMATION,
+            ctypes.byref(info),
+            ctypes.sizeof(info)
+        ) and
+        kernel32.AssignProcessToJobObject(
+            ctypes.c_void_p(job),
+            ctypes.c_void_p(kernel32.GetCurrentProcess())
+        )
+    )
+    if not success:
+        kernel32.CloseHandle(ctypes.c_void_p(job))
+        return False
+    worker_data['job'] = job
+    return True
+
+
+def set_memory_limit(memory_limit):
+    # allocations over the limit raise MemoryError in the worker,
+    # the frame fails instead of the whole system swapping
+    limit = memory_limit * MEGABYTE
+    if sys.platform == 'win32':
+        success = set_job_memory_limit(limit)
+    else:
+        try:
+            import resource
+        except ImportError:
+            success = False
+        else:
+            # limit over the hard limit or no permission to raise it
+            try:
+                resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+                success = True
+            except (ValueError, OSError):
+                success = False
+    if not success:
+        print_mesh_info('Can\'t set the worker memory limit')
+
+
+def init_worker(settings, memory_limit):
+    pyjet.Logging.mute()
+    if memory_limit:
+        set_memory_limit(memory_limit)
+    worker_data['settings'] = settings
+    worker_data['converter'] = create_converter(settings)
+
+
+def mesh_frame_worker(frame_index):
+    result = mesh_frame(
+        worker_data['settings'],
+        worker_data['converter'],
+        frame_index
+    )
+    result['worker'] = os.getpid()
+    return result
+
+
+def add_profile(result, thread=None):
+    # frames of the workers are timed in their processes, the phases
+    # are added to the host profiler one after another
+    if 'time' not in result:
+        return
+    start_time = time.perf_counter() - result['time']
+    profiler.profiler.add('Mesh frame', result['time'], start_time, thread)
+    for name, key in MESH_PHASES:
+        if key in result:
+            profiler.profiler.add('Mesh frame/' + name, result[key], start_time, thread)
+            start_time += result[key]
+
+
+@contextlib.contextmanager
+def hidden_main_file():
+    # spawned workers must not run the main script of the host process again
+    main_module = sys.modules['__main__']
+    main_file = getattr(main_module, '__file__', None)
+    if main_file is not None:
+        del main_module.__file__
+    try:
+        yield
+    finally:
+        if main_file is not None:
+            main_module.__file__ = main_file
+
+
+def bake_frames(settings, frames, workers=1, memory_limit=0, progress=None):
+    # returns the list of frames, that failed
+    if not frames:
+        return []
+    if not workers:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(frames))
+    failed = []
+    if workers <= 1:
+        pyjet.Logging.mute()
+        converter = create_converter(settings)
+        for index, frame_index in enumerate(frames):
+            try:
+                result = mesh_frame(settings, converter, frame_index)
+            except Exception as error:
+                print_mesh_info('Mesh frame {0} failed: {1}'.format(frame_index, error))
+                failed.append(frame_index)
+                result = {'frame': frame_index, 'error': str(error)}
+            add_profile(result)
+            if progress:
+                progress(index + 1, len(frames), result)
+        return failed
+    # spawn, because forking the host application is not safe
+    context = multiprocessing.get_context('spawn')
+    with hidden_main_file(), concurrent.futures.ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=context,
+            initializer=init_worker,
+            initargs=(settings, memory_limit)
+        ) as executor:
+        futures = {
+            executor.submit(mesh_frame_worker, frame_index): frame_index
+            for frame_index in frames
+        }
+        for index, future in enumerate(concurrent.futures.as_completed(futures)):
+            frame_index = futures[future]
+            try:
+                result = future.result()
+            except Exception as error:
+                print_mesh_info('Mesh frame {0} failed: {1}'.format(frame_index, error))
+                failed.append(frame_index)
+                result = {'frame': frame_index, 'error': str(error)}
+            add_profile(result, result.pop('worker', None))
+            if progress:
+                progress(index + 1, len(frames), result)
+    return sorted(failed)
+
+
+def get_file_hash(file_path):
+    file_hash = hashlib.blake2b(digest_size=16)
+    with open(file_path, 'rb') as file:
+        for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b''):
+            file_hash.update(chunk)
+    return file_hash.hexdigest()
+
+
+def get_input_fingerprint(file_path, previous=None):
+    if not os.path.exists(file_path):
+        return
+    stat = os.stat(file_path)
+    fingerprint = {'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+    if previous and previous['size'] == stat.st_size and previous['mtime'] == stat.st_mtime_ns:
+        fingerprint['hash'] = previous['hash']
+    else:
+        # hash only when size or time changed, rewritten files
+        # with the same content are not meshed again
+        fingerprint['hash'] = get_file_hash(file_path)
+    return fingerprint
+
+
+def get_params_fingerprint(settings):
+    params = {
+        key: value for key, value in settings.items()
+        if key != 'cache_folder'
+    }
+    data = json.dumps(params, sort_keys=True).encode()
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def is_same_fingerprint(record, fingerprint):
+    if not record or not record['input'] or not fingerprint['input']:
+        return False
+    return (
+        record['params'] == fingerprint['params'] and
+        record['input']['hash'] == fingerprint['input']['hash']
+    )
+
+
+def get_outdated_frames(settings, frames, cache_manifest, overwrite=False):
+    # returns {frame: fingerprint} of the frames, whose particles,
+    # meshing parameters or mesh entries changed since the last bake,
+    # records of unchanged frames get the new file times
+    params = get_params_fingerprint(settings)
+    outdated = {}
+    for frame_index in frames:
+        record = cache_manifest.get(manifest.MESH, frame_index)
+        particles_path = cache.get_frame_path(settings['cache_folder'], 'particles', frame_index)
+        previous = record['input'] if record else None
+        fingerprint = {
+            'input': get_input_fingerprint(particles_path, previous),
+            'params': params
+        }
+        if overwrite or not is_same_fingerprint(record, fingerprint):
+            outdated[frame_index] = fingerprint
+        else:
+            if record['input'] != fingerprint['input']:
+                cache_manifest.update(manifest.MESH, frame_index, dict(record, **fingerprint), save=False)
+            print_mesh_info('Skip frame', frame_index)
+    return outdated
+
+
+def bake_outdated_frames(settings, frames, overwrite=False, workers=1, memory_limit=0, progress=None):
+    cache_manifest = manifest.get_manifest(settings['cache_folder'])
+    outdated = get_outdated_frames(settings, frames, cache_manifest, overwrite)
+    cache_manifest.save()
+
+    def update(done_count, frames_count, result):
+        fingerprint = outdated[result['frame']]
+        if 'error' not in result and fingerprint['input'] is not None:
+            entry = dict(result, **fingerprint)
+            del entry['frame']
+            cache_manifest.update(manifest.MESH, result['frame'], entry)
+        if progress:
+            progress(done_count, frames_count, result)
+
+    return bake_frames(
+        settings,
+        sorted(outdated),
+        workers=workers,
+        memory_limit=memory_limit,
+        progress=update
+    )
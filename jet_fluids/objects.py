@@ -102,14 +102,32 @@ class JetFluidsProperties(bpy.types.PropertyGroup):
     overwrite_simulation: bpy.props.BoolProperty(
         default=False, name='Overwrite'
     )
+    checkpoint_interval: bpy.props.IntProperty(
+        default=10,
+        min=0,
+        name='Checkpoint Interval'
+    )
+    profiling: bpy.props.BoolProperty(
+        default=False, name='Profiling'
+    )
 
     # mesh generator properties
     resolution_mesh: bpy.props.IntProperty(default=30, name='Mesh Resolution', min=1)
+    mesh_sparse_grid: bpy.props.BoolProperty(
+        default=True, name='Sparse Grid'
+    )
+    mesh_tile_size: bpy.props.IntProperty(
+        default=32,
+        min=4,
+        name='Tile Size'
+    )
     items = [
         ('ANISOTROPICPOINTSTOIMPLICIT', 'Anisotropic Points to Implicit', ''),
         ('SPHPOINTSTOIMPLICIT', 'SPH Points to Implicit', ''),
         ('SPHERICALPOINTSTOIMPLICIT', 'Spherical Points to Implicit', ''),
-        ('ZHUBRIDSONPOINTSTOIMPLICIT', 'Zhu Bridson Points to Implicit', '')
+        ('ZHUBRIDSONPOINTSTOIMPLICIT', 'Zhu Bridson Points to Implicit', ''),
+        ('NUMPYSPHERICALPOINTSTOIMPLICIT', 'Spherical Points to Implicit (NumPy)', ''),
+        ('NUMPYZHUBRIDSONPOINTSTOIMPLICIT', 'Zhu Bridson Points to Implicit (NumPy)', '')
     ]
     converter_type: bpy.props.EnumProperty(
         items=items,
@@ -169,6 +187,19 @@ class JetFluidsProperties(bpy.types.PropertyGroup):
     overwrite_mesh: bpy.props.BoolProperty(
         default=False, name='Overwrite'
     )
+    mesh_workers: bpy.props.IntProperty(
+        default=1,
+        min=0,
+        name='Workers'
+    )
+    mesh_worker_memory: bpy.props.IntProperty(
+        default=0,
+        min=0,
+        name='Worker Memory Limit'
+    )
+    mesh_progress: bpy.props.BoolProperty(
+        default=True, name='Print Progress'
+    )
 
     # boundary
     bound_right: bpy.props.BoolProperty(default=True, name='Right')
@@ -207,6 +238,48 @@ class JetFluidsProperties(bpy.types.PropertyGroup):
         subtype='DIR_PATH'
     )
 
+    items = [
+        ('FLOAT', 'Float', ''),
+        ('QUANTIZED', 'Quantized', ''),
+        ('DELTA', 'Delta', '')
+    ]
+    cache_positions: bpy.props.EnumProperty(
+        items=items,
+        name='Positions',
+        default='FLOAT'
+    )
+    cache_keyframe_interval: bpy.props.IntProperty(
+        default=10,
+        min=1,
+        max=100,
+        name='Keyframe Interval'
+    )
+    items = [
+        ('FLOAT', 'Float', ''),
+        ('HALF', 'Half Float', '')
+    ]
+    cache_velocities: bpy.props.EnumProperty(
+        items=items,
+        name='Velocities',
+        default='FLOAT'
+    )
+    items = [
+        ('NONE', 'None', ''),
+        ('ZLIB', 'Zlib', ''),
+        ('LZMA', 'LZMA', '')
+    ]
+    cache_compression: bpy.props.EnumProperty(
+        items=items,
+        name='Compression',
+        default='NONE'
+    )
+    cache_tolerance: bpy.props.FloatProperty(
+        default=0.001,
+        min=0.000001,
+        precision=6,
+        name='Tolerance'
+    )
+
     # world props
     viscosity: bpy.props.FloatProperty(default=0.0, name='Viscosity', min=0.0)
     gravity: bpy.props.FloatVectorProperty(
@@ -256,6 +329,9 @@ class JetFluidsProperties(bpy.types.PropertyGroup):
         precision=3,
         subtype='FACTOR'
     )
+    collider_deforming: bpy.props.BoolProperty(
+        default=False, name='Deforming'
+    )
 
     # create props
     create_mesh: bpy.props.BoolProperty(
@@ -270,6 +346,50 @@ class JetFluidsProperties(bpy.types.PropertyGroup):
         update=create.update_par_object
     )
     particles_object: bpy.props.StringProperty(default='', name='Particles')
+    memory_cache_size: bpy.props.IntProperty(
+        default=512,
+        min=0,
+        name='Memory Cache',
+        update=create.update_memory_cache
+    )
+    prefetch_frames: bpy.props.IntProperty(
+        default=4,
+        min=0,
+        name='Prefetch Frames'
+    )
+
+
+# scene links and viewport options are not part of the bake config
+CONFIG_EXCLUDE = {
+    'rna_type',
+    'is_active',
+    'object_type',
+    'mesh_object',
+    'particles_object',
+    'create_mesh',
+    'create_particles'
+}
+
+
+def get_config(jet):
+    config = {}
+    for prop in jet.bl_rna.properties:
+        if prop.identifier in CONFIG_EXCLUDE or prop.is_readonly:
+            continue
+        value = getattr(jet, prop.identifier)
+        if getattr(prop, 'is_array', False):
+            value = list(value)
+        config[prop.identifier] = value
+    return config
+
+
+def set_config(jet, config):
+    for name, value in config.items():
+        if name in CONFIG_EXCLUDE:
+            continue
+        if name not in jet.bl_rna.properties:
+            raise KeyError('Unknown property: "{}"'.format(name))
+        setattr(jet, name, value)
 
 
 def register():
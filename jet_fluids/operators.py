@@ -1,7 +1,14 @@
 import os
 import re
+import json
 
 import bpy
+import bpy_extras
+
+from . import bake
+from . import manifest
+from . import objects
+from . import telemetry
 
 
 class JET_OT_ResetMesh(bpy.types.Operator):
@@ -11,12 +18,13 @@ class JET_OT_ResetMesh(bpy.types.Operator):
 
     def execute(self, context):
         obj = context.object
-        file_path = bpy.path.abspath(obj.jet_fluid.cache_folder)
+        file_path = bake.get_cache_folder(obj.jet_fluid)
         if not os.path.exists(file_path):
             return {'FINISHED'}
         for file in os.listdir(file_path):
             if re.search('(vert|tris)_[0-9]*.bin', file):
                 os.remove(file_path + file)
+        manifest.get_manifest(file_path).clear(manifest.MESH)
         return {'FINISHED'}
 
 
@@ -27,12 +35,17 @@ class JET_OT_ResetParticles(bpy.types.Operator):
 
     def execute(self, context):
         obj = context.object
-        file_path = bpy.path.abspath(obj.jet_fluid.cache_folder)
+        file_path = bake.get_cache_folder(obj.jet_fluid)
         if not os.path.exists(file_path):
             return {'FINISHED'}
         for file in os.listdir(file_path):
-            if re.search('(pos|vel|force)_[0-9]*.bin', file):
+            if re.search('(particles|pos|vel|force)_[0-9]*.bin', file):
+                os.remove(file_path + file)
+            elif re.search('checkpoint_[0-9]*.npz', file):
+                os.remove(file_path + file)
+            elif file == telemetry.TELEMETRY_FILE:
                 os.remove(file_path + file)
+        manifest.get_manifest(file_path).clear(manifest.PARTICLES)
         return {'FINISHED'}
 
 
@@ -59,11 +72,28 @@ class JET_OT_Remove(bpy.types.Operator):
         return {'FINISHED'}
 
 
+class JET_OT_ExportConfig(bpy.types.Operator, bpy_extras.io_utils.ExportHelper):
+    bl_idname = "jet_fluid.export_config"
+    bl_label = "Export Jet Fluid Config"
+    bl_options = {'REGISTER'}
+
+    filename_ext = '.json'
+    filter_glob: bpy.props.StringProperty(default='*.json', options={'HIDDEN'})
+
+    def execute(self, context):
+        obj = context.object
+        config = objects.get_config(obj.jet_fluid)
+        with open(self.filepath, 'w') as file:
+            json.dump(config, file, indent=4, sort_keys=True)
+        return {'FINISHED'}
+
+
 __CLASSES__ = [
     JET_OT_Add,
     JET_OT_Remove,
     JET_OT_ResetParticles,
-    JET_OT_ResetMesh
+    JET_OT_ResetMesh,
+    JET_OT_ExportConfig
 ]
 
 
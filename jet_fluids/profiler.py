@@ -0,0 +1,171 @@
+import os
+import json
+import math
+import time
+import threading
+
+
+# nested timers of a bake:
+#     with profiler.scope('Solver update'):
+#         ...
+# scopes are aggregated by their path ('Frame/Solver update'), when the
+# profiler is disabled, scope returns a shared empty context manager
+TRACE_FILE = 'profile_{}.json'
+
+
+class NullScope:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULL_SCOPE = NullScope()
+
+
+class Scope:
+    def __init__(self, profiler, name):
+        self.profiler = profiler
+        self.name = name
+
+    def __enter__(self):
+        self.stack = self.profiler.get_stack()
+        self.stack.append(self.name)
+        self.path = '/'.join(self.stack)
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        end_time = time.perf_counter()
+        self.stack.pop()
+        self.profiler.add(self.path, end_time - self.start_time, self.start_time)
+        return False
+
+
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.clear()
+
+    def clear(self):
+        with self.lock:
+            self.durations = {}
+            self.events = []
+            self.start_time = time.perf_counter()
+
+    def get_stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = []
+            self.local.stack = stack
+        return stack
+
+    def scope(self, name):
+        if not self.enabled:
+            return NULL_SCOPE
+        return Scope(self, name)
+
+    def add(self, path, duration, start_time=None, thread=None):
+        # durations measured elsewhere (mesh workers) are added
+        # as they have just finished, thread is the trace lane
+        if not self.enabled:
+            return
+        if start_time is None:
+            start_time = time.perf_counter() - duration
+        if thread is None:
+            thread = threading.get_ident()
+        with self.lock:
+            self.durations.setdefault(path, []).append(duration)
+            self.events.append((path.rsplit('/', 1)[-1], start_time, duration, thread))
+
+    def get_stats(self):
+        # returns {path: (count, total, min, max, p95)}
+        stats = {}
+        with self.lock:
+            items = [(path, sorted(values)) for path, values in self.durations.items()]
+        for path, values in items:
+            p95 = values[max(math.ceil(len(values) * 0.95) - 1, 0)]
+            stats[path] = (len(values), sum(values), values[0], values[-1], p95)
+        return stats
+
+    def get_summary(self, title):
+        stats = self.get_stats()
+        lines = [
+            '-' * 79,
+            '{0} PROFILE'.format(title),
+            '{0:<40} {1:>6} {2:>8} {3:>7} {4:>7} {5:>7}'.format(
+                'Scope', 'Count', 'Total', 'Min', 'Max', 'P95'
+            )
+        ]
+        # children are printed under their parents
+        for path in sorted(stats, key=lambda path: path.split('/')):
+            count, total, min_time, max_time, p95 = stats[path]
+            depth = path.count('/')
+            name = '  ' * depth + path.rsplit('/', 1)[-1]
+            lines.append('{0:<40} {1:>6} {2:>8.3f} {3:>7.3f} {4:>7.3f} {5:>7.3f}'.format(
+                name[ : 40], count, total, min_time, max_time, p95
+            ))
+        return '\n'.join(lines)
+
+    def save_trace(self, file_path):
+        # chrome trace event format, opens in chrome://tracing and perfetto
+        pid = os.getpid()
+        with self.lock:
+            events = [
+                {
+                    'name': name,
+                    'ph': 'X',
+                    'ts': (start_time - self.start_time) * 1e6,
+                    'dur': duration * 1e6,
+                    'pid': pid,
+                    'tid': thread
+                }
+                for name, start_time, duration, thread in self.events
+            ]
+        temp_path = file_path + '.tmp'
+        with open(temp_path, 'w') as file:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, file)
+        os.replace(temp_path, file_path)
+
+
+profiler = Profiler()
+
+
+def scope(name):
+    return profiler.scope(name)
+
+
+def profile(name):
+    # decorator, the call is not wrapped, while the profiler is disabled
+    def decorator(fun):
+        def wrapper(*args, **kw):
+            if not profiler.enabled:
+                return fun(*args, **kw)
+            with profiler.scope(name):
+                return fun(*args, **kw)
+        return wrapper
+    return decorator
+
+
+def start(enabled):
+    profiler.clear()
+    profiler.enabled = enabled
+
+
+def finish(title, folder=None, stage=None):
+    # prints the summary and saves the trace into the cache folder
+    if not profiler.enabled:
+        return
+    profiler.enabled = False
+    print(profiler.get_summary(title))
+    if folder and stage:
+        file_path = os.path.join(folder, TRACE_FILE.format(stage))
+        try:
+            profiler.save_trace(file_path)
+        except OSError as error:
+            print('Can\'t save profile "{0}": {1}'.format(file_path, error))
+        else:
+            print('Profile trace: "{}"'.format(file_path))
@@ -0,0 +1,117 @@
+import os
+import json
+import threading
+
+
+# solver statistics of the last particles bake, one json object per line,
+# the first line describes the bake:
+#     {"bake": {"start": ..., "solver_type": ..., "max_cfl": ...}}
+#     {"frame": 1, "particles": ..., "substeps": ..., "max_speed": ..., ...}
+# lines are appended, while the frames are saved
+TELEMETRY_FILE = 'telemetry.jsonl'
+RECORD_KEYS = (
+    'particles',
+    'substeps',
+    'max_speed',
+    'cfl',
+    'substep_cfl',
+    'rebuild_time',
+    'update_time',
+    'save_time'
+)
+
+
+class Telemetry:
+    def __init__(self, cache_folder):
+        self.file_path = os.path.join(cache_folder, TELEMETRY_FILE)
+        self.lock = threading.RLock()
+        self.signature = None
+        self.bake = {}
+        self.frames = {}
+        self.load()
+
+    def get_signature(self):
+        try:
+            stat = os.stat(self.file_path)
+        except OSError:
+            return
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def load(self):
+        with self.lock:
+            signature = self.get_signature()
+            self.bake = {}
+            self.frames = {}
+            if signature is not None:
+                with open(self.file_path) as file:
+                    for line in file:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            # the last line of an interrupted bake
+                            continue
+                        if 'bake' in record:
+                            self.bake = record['bake']
+                        elif 'frame' in record:
+                            self.frames[record['frame']] = record
+            self.signature = signature
+
+    def reload(self):
+        with self.lock:
+            if self.get_signature() != self.signature:
+                self.load()
+
+    def write(self, record, mode):
+        with open(self.file_path, mode) as file:
+            file.write(json.dumps(record, sort_keys=True) + '\n')
+        self.signature = self.get_signature()
+
+    def start(self, bake):
+        # records of the previous bake are removed
+        with self.lock:
+            self.bake = bake
+            self.frames = {}
+            self.write({'bake': bake}, 'w')
+
+    def add(self, frame, entry):
+        record = {key: entry[key] for key in RECORD_KEYS if entry.get(key) is not None}
+        record['frame'] = frame
+        with self.lock:
+            self.frames[frame] = record
+            self.write(record, 'a')
+
+    def get_summary(self):
+        with self.lock:
+            records = [self.frames[frame] for frame in sorted(self.frames)]
+        if not records:
+            return
+        summary = {
+            'frames': len(records),
+            'particles': records[-1].get('particles', 0)
+        }
+        for key in ('update_time', 'save_time', 'substeps', 'rebuild_time'):
+            values = [record[key] for record in records if key in record]
+            if values:
+                summary[key] = sum(values) / len(values)
+                summary['max_' + key] = max(values)
+        for key in ('max_speed', 'cfl'):
+            values = [record[key] for record in records if key in record]
+            if values:
+                summary[key] = max(values)
+        slowest = max(records, key=lambda record: record.get('update_time', 0.0))
+        summary['slowest_frame'] = slowest['frame']
+        return summary
+
+
+telemetries = {}
+telemetries_lock = threading.Lock()
+
+
+def get_telemetry(cache_folder):
+    with telemetries_lock:
+        telemetry = telemetries.get(cache_folder)
+        if telemetry is None:
+            telemetry = Telemetry(cache_folder)
+            telemetries[cache_folder] = telemetry
+    telemetry.reload()
+    return telemetry
@@ -1,5 +1,10 @@
 import bpy
 
+from . import bake
+from . import frame_cache
+from . import manifest
+from . import telemetry
+
 
 def draw_prop(
         layout,
@@ -35,6 +40,57 @@ def draw_prop(
             value_layout.prop(prop_owner, prop_name, text='')
 
 
+def draw_cache_info(layout, jet, stage):
+    if not jet.cache_folder:
+        return
+    cache_manifest = manifest.get_manifest(bake.get_cache_folder(jet))
+    frames = cache_manifest.get_frames(stage)
+    if not frames:
+        return
+    layout.label(text='Baked: {0} frames ({1}-{2}), {3:.1f} MB'.format(
+        len(frames),
+        frames[0],
+        frames[-1],
+        cache_manifest.get_total_size(stage) / frame_cache.MEGABYTE
+    ))
+
+
+def draw_telemetry(layout, jet):
+    # the file is read again, when another process appends frames
+    if not jet.cache_folder:
+        return
+    summary = telemetry.get_telemetry(bake.get_cache_folder(jet)).get_summary()
+    if not summary:
+        return
+    column = layout.column(align=True)
+    column.label(text='Last Bake: {0} frames, {1} particles'.format(
+        summary['frames'],
+        summary['particles']
+    ))
+    if 'update_time' in summary:
+        column.label(text='Update: {0:.2f} sec avg, {1:.2f} sec max (frame {2})'.format(
+            summary['update_time'],
+            summary['max_update_time'],
+            summary['slowest_frame']
+        ))
+    if 'substeps' in summary:
+        column.label(text='Substeps: {0:.1f} avg, {1} max'.format(
+            summary['substeps'],
+            summary['max_substeps']
+        ))
+    column.label(text='Max Speed: {0:.2f}, Max CFL: {1:.2f}'.format(
+        summary.get('max_speed', 0.0),
+        summary.get('cfl', 0.0)
+    ))
+    if 'save_time' in summary:
+        column.label(text='Save: {0:.3f} sec avg'.format(summary['save_time']))
+    if summary.get('max_rebuild_time'):
+        column.label(text='Collider Rebuild: {0:.2f} sec avg, {1:.2f} sec max'.format(
+            summary['rebuild_time'],
+            summary['max_rebuild_time']
+        ))
+
+
 class DomainBasePanel(bpy.types.Panel):
     bl_space_type = "PROPERTIES"
     bl_region_type = "WINDOW"
@@ -85,6 +141,7 @@ class JET_PT_Collider(bpy.types.Panel):
 
         # create ui elements
         draw_prop(lay, jet, 'collider_friction', 'Friction')
+        draw_prop(lay, jet, 'collider_deforming', 'Deforming', boolean=True)
 
 
 class JET_PT_Emitter(bpy.types.Panel):
@@ -223,6 +280,16 @@ class JET_PT_Create(DomainBasePanel):
         draw_prop(lay, jet, 'create_particles', 'Create Particles', boolean=True)
         draw_prop(lay, jet, 'particles_object', 'Particles Object', prop_search='objects', active=jet.create_particles)
 
+        # memory cache
+        draw_prop(lay, jet, 'memory_cache_size', 'Memory Cache (MB)')
+        draw_prop(lay, jet, 'prefetch_frames', 'Prefetch Frames', active=bool(jet.memory_cache_size))
+        memory = frame_cache.get_cache(obj.name)
+        lay.label(text='Cached: {0:.1f} MB, Hits: {1}, Misses: {2}'.format(
+            memory.size / frame_cache.MEGABYTE,
+            memory.hits,
+            memory.misses
+        ))
+
 
 class JET_PT_Mesh(DomainBasePanel):
     bl_label = "Jet Fluid: Mesh"
@@ -241,8 +308,13 @@ class JET_PT_Mesh(DomainBasePanel):
         split.alert = True
         split.operator('jet_fluid.reset_mesh', text="Reset")
         draw_prop(lay, jet, 'resolution_mesh', 'Resolution')
+        draw_prop(lay, jet, 'mesh_sparse_grid', 'Sparse Grid', boolean=True)
+        draw_prop(lay, jet, 'mesh_tile_size', 'Tile Size', active=jet.mesh_sparse_grid)
         draw_prop(lay, jet, 'overwrite_mesh', 'Overwrite', boolean=True)
-        draw_prop(lay, jet, 'is_output_sdf', 'Out SDF', boolean=True)
+        draw_prop(lay, jet, 'mesh_workers', 'Workers (0 - All Cores)')
+        draw_prop(lay, jet, 'mesh_worker_memory', 'Worker Memory (MB)', active=jet.mesh_workers != 1)
+        draw_prop(lay, jet, 'mesh_progress', 'Print Progress', boolean=True)
+        draw_prop(lay, jet, 'is_output_sdf', 'Out SDF', boolean=True, active=not jet.converter_type.startswith('NUMPY'))
         draw_prop(lay, jet, 'iso_value', 'Iso Value')
 
         # frame range
@@ -257,6 +329,7 @@ class JET_PT_Mesh(DomainBasePanel):
         else:
             draw_prop(lay, jet, 'frame_range_mesh_start', 'Frame Start')
             draw_prop(lay, jet, 'frame_range_mesh_end', 'Frame End')
+        draw_cache_info(lay, jet, manifest.MESH)
 
         draw_prop(lay, jet, 'converter_type', 'Method', expand=True, use_column=True)
         if jet.converter_type == 'ANISOTROPICPOINTSTOIMPLICIT':
@@ -267,9 +340,9 @@ class JET_PT_Mesh(DomainBasePanel):
         elif jet.converter_type == 'SPHPOINTSTOIMPLICIT':
             draw_prop(lay, jet, 'kernel_radius', 'Kernel Radius')
             draw_prop(lay, jet, 'cut_off_density', 'Cut Off Density')
-        elif jet.converter_type == 'SPHERICALPOINTSTOIMPLICIT':
+        elif jet.converter_type in ('SPHERICALPOINTSTOIMPLICIT', 'NUMPYSPHERICALPOINTSTOIMPLICIT'):
             draw_prop(lay, jet, 'radius', 'Radius')
-        elif jet.converter_type == 'ZHUBRIDSONPOINTSTOIMPLICIT':
+        elif jet.converter_type in ('ZHUBRIDSONPOINTSTOIMPLICIT', 'NUMPYZHUBRIDSONPOINTSTOIMPLICIT'):
             draw_prop(lay, jet, 'kernel_radius', 'Kernel Radius')
             draw_prop(lay, jet, 'cut_off_threshold', 'Cut Off Threshold')
 
@@ -294,10 +367,18 @@ class JET_PT_Simulate(DomainBasePanel):
         split.operator('jet_fluid.reset_particles', text="Reset")
 
         draw_prop(lay, jet, 'cache_folder', 'Cache Folder')
+        lay.operator('jet_fluid.export_config', text='Export Config')
+        draw_prop(lay, jet, 'cache_positions', 'Positions', expand=True)
+        draw_prop(lay, jet, 'cache_tolerance', 'Tolerance', active=jet.cache_positions != 'FLOAT')
+        draw_prop(lay, jet, 'cache_keyframe_interval', 'Keyframe Interval', active=jet.cache_positions == 'DELTA')
+        draw_prop(lay, jet, 'cache_velocities', 'Velocities', expand=True)
+        draw_prop(lay, jet, 'cache_compression', 'Compression', expand=True)
         draw_prop(lay, jet, 'resolution', 'Resolution')
 
         # fps
         draw_prop(lay, jet, 'overwrite_simulation', 'Overwrite', boolean=True)
+        draw_prop(lay, jet, 'checkpoint_interval', 'Checkpoint Interval')
+        draw_prop(lay, jet, 'profiling', 'Profiling', boolean=True)
         draw_prop(lay, jet, 'fps_mode', 'FPS Mode', expand=True, use_column=True)
         if jet.fps_mode == 'SCENE':
             draw_prop(lay, context.scene.render, 'fps', 'FPS', active=False)
@@ -312,6 +393,8 @@ class JET_PT_Simulate(DomainBasePanel):
         else:
             draw_prop(lay, context.scene, 'frame_start', 'Frame Start', active=False)
             draw_prop(lay, context.scene, 'frame_end', 'Frame End', active=False)
+        draw_cache_info(lay, jet, manifest.PARTICLES)
+        draw_telemetry(lay, jet)
 
 
 def add_jet_fluid_button(self, context):
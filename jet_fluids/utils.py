@@ -24,19 +24,5 @@ def convert_time_to_string(start_time):
     return time_string
 
 
-def time_stats(name):
-    def decorator(fun):
-        def wrapper(*args, **kw):
-            import time
-            start_time = time.time()
-            result = fun(*args, **kw)
-            end_time = time.time()
-            total_time = end_time - start_time
-            print('{0}: {1:.3f} sec'.format(name, total_time))
-            return result
-        return wrapper
-    return decorator
-
-
 def print_info(*print_params):
     print(*print_params)
@@ -1,45 +1,683 @@
 import os
+import sys
+import json
+import time
+import ctypes
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
 
-import bpy
+import numpy
 
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
 
-solvers = ['FLIP', 'PIC', 'APIC']
-cache_folder = os.path.join(os.path.abspath(os.curdir), 'tests_cache')
-cache_folder += os.sep
-if not os.path.exists(cache_folder):
-    os.makedirs(cache_folder)
+from jet_fluids import pyjet
+from jet_fluids import cache
+from jet_fluids import core
+from jet_fluids import mesher
+from jet_fluids import manifest
 
-for solver in solvers:
-    bpy.ops.mesh.primitive_cube_add(
-        size=2, enter_editmode=False, location=(0, 0, 0)
+try:
+    import bpy
+    from jet_fluids import create
+except ImportError:
+    # frame import is measured only inside blender
+    bpy = None
+
+
+SOLVERS = ('FLIP', 'PIC', 'APIC')
+RESOLUTIONS = (32, 64, 128)
+CONVERTERS = (
+    'ZHUBRIDSONPOINTSTOIMPLICIT',
+    'SPHPOINTSTOIMPLICIT',
+    'SPHERICALPOINTSTOIMPLICIT',
+    'ANISOTROPICPOINTSTOIMPLICIT',
+    'NUMPYZHUBRIDSONPOINTSTOIMPLICIT',
+    'NUMPYSPHERICALPOINTSTOIMPLICIT'
+)
+COLLIDERS = (0, 4)
+# particle frames saved without the solver, large counts
+# are too slow to simulate for the benchmark
+SAVE_PARTICLES = (1000000, 10000000)
+SAVE_REPEATS = 3
+PHASES = (
+    'solver_update',
+    'particle_save',
+    'particle_load',
+    'points_to_implicit',
+    'marching_cubes',
+    'mesh_save',
+    'frame_import',
+    'sparse_mesh'
+)
+# phases faster than this are too noisy to compare
+MIN_COMPARE_TIME = 0.01
+# allowed difference of the numpy and pyjet fields in the grid cells
+EQUIVALENCE_TOLERANCE = 1e-6
+# positions encodings and compressions of the cache round trip check,
+# delta frames are written up to the longest keyframe interval
+CACHE_ENCODINGS = (
+    ('QUANTIZED', 'NONE'),
+    ('DELTA', 'NONE'),
+    ('FLOAT', 'LZMA'),
+    ('QUANTIZED', 'LZMA'),
+    ('DELTA', 'LZMA')
+)
+CACHE_CHECK_FRAMES = 120
+CACHE_CHECK_PARTICLES = 10000
+CACHE_KEYFRAME_INTERVAL = 100
+# frames of the operators smoke run inside blender
+SMOKE_FRAMES = (1, 4)
+MEMORY_SAMPLE_INTERVAL = 0.005
+
+DOMAIN = {
+    'origin': (-1.0, -1.0, 0.0),
+    'size': (2.0, 2.0, 2.0),
+    'location': (0.0, 0.0, 1.0)
+}
+SETTINGS = {
+    'max_cfl': 5.0,
+    'advection_solver_type': 'CUBIC_SEMI_LAGRANGIAN',
+    'diffusion_solver_type': 'BACKWARD_EULER',
+    'pressure_solver_type': 'FRACTIONAL_SINGLE_PHASE',
+    'compressed_linear_system': True,
+    'fixed_substeps': False,
+    'fixed_substeps_count': 1,
+    'closed_boundary': [True] * 6,
+    'viscosity': 0.0,
+    'gravity': (0.0, 0.0, -9.8),
+    'time_interval': 1.0 / 24.0,
+    'cache_positions': 'FLOAT',
+    'cache_tolerance': 0.001,
+    'cache_keyframe_interval': 10,
+    'cache_velocities': 'FLOAT',
+    'cache_compression': 'NONE',
+    'checkpoint_interval': 0,
+    'overwrite': True
+}
+MESH_OPTIONS = {
+    'kernel_radius': 1.0,
+    'cut_off_density': 0.5,
+    'position_smoothing_factor': 0.5,
+    'min_num_neighbors': 25,
+    'is_output_sdf': True,
+    'radius': 1.0,
+    'cut_off_threshold': 0.25,
+    'iso_value': 0.0,
+    'mesh_sparse_grid': False,
+    'mesh_tile_size': 32,
+    'close_boundary': [True] * 6,
+    'connectivity_boundary': [True] * 6
+}
+
+
+def get_memory():
+    # resident memory of the process in bytes
+    if sys.platform == 'win32':
+        class MemoryCounters(ctypes.Structure):
+            _fields_ = [
+                ('cb', ctypes.c_ulong),
+                ('PageFaultCount', ctypes.c_ulong),
+                ('PeakWorkingSetSize', ctypes.c_size_t),
+                ('WorkingSetSize', ctypes.c_size_t),
+                ('QuotaPeakPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaPeakNonPagedPoolUsage', ctypes.c_size_t),
+                ('QuotaNonPagedPoolUsage', ctypes.c_size_t),
+                ('PagefileUsage', ctypes.c_size_t),
+                ('PeakPagefileUsage', ctypes.c_size_t)
+            ]
+        counters = MemoryCounters()
+        counters.cb = ctypes.sizeof(counters)
+        ctypes.windll.psapi.GetProcessMemoryInfo(
+            ctypes.windll.kernel32.GetCurrentProcess(),
+            ctypes.byref(counters),
+            counters.cb
+        )
+        return counters.WorkingSetSize
+    with open('/proc/self/statm') as file:
+        return int(file.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+class Phase:
+    # measures the wall time and the peak resident memory of a block,
+    # memory is sampled in a thread, because the solver allocates in c++
+    def __init__(self, stats, name):
+        self.stats = stats.setdefault(name, {
+            'count': 0,
+            'time': 0.0,
+            'peak_memory': 0,
+            'bytes_written': 0
+        })
+        self.bytes_written = 0
+        self.peak = 0
+        self.running = False
+
+    def sample(self):
+        while self.running:
+            self.peak = max(self.peak, get_memory())
+            time.sleep(MEMORY_SAMPLE_INTERVAL)
+
+    def __enter__(self):
+        self.peak = get_memory()
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+        self.start_time = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        total_time = time.perf_counter() - self.start_time
+        self.running = False
+        self.thread.join()
+        self.peak = max(self.peak, get_memory())
+        self.stats['count'] += 1
+        self.stats['time'] += total_time
+        self.stats['peak_memory'] = max(self.stats['peak_memory'], self.peak)
+        self.stats['bytes_written'] += self.bytes_written
+
+
+def create_box(name, center, size):
+    offsets = numpy.array([
+        (x, y, z) for x in (-0.5, 0.5) for y in (-0.5, 0.5) for z in (-0.5, 0.5)
+    ])
+    triangles = numpy.array([
+        (0, 1, 3), (0, 3, 2), (4, 6, 7), (4, 7, 5),
+        (0, 4, 5), (0, 5, 1), (2, 3, 7), (2, 7, 6),
+        (0, 2, 6), (0, 6, 4), (1, 5, 7), (1, 7, 3)
+    ])
+    return {
+        'name': name,
+        'points': offsets * size,
+        'triangles': triangles,
+        'center': center,
+        'frames': {}
+    }
+
+
+def create_sources(colliders_count, frames):
+    emitter = create_box('emitter', (0.0, 0.0, 1.5), (1.0, 1.0, 0.6))
+    emitter.update(
+        particles_count=1.0,
+        one_shot=True,
+        jitter=0.0,
+        allow_overlapping=False,
+        seed=0,
+        max_number_of_particles=10 ** 8
     )
-    domain_object = bpy.context.object
-    bpy.ops.jet_fluid.add()
-    domain_object.jet_fluid.object_type = 'DOMAIN'
-    domain_object.jet_fluid.resolution = 20
-    domain_object.jet_fluid.solver_type = solver
-    domain_object.jet_fluid.cache_folder = cache_folder
-    
-    bpy.context.scene.frame_start = 0
-    bpy.context.scene.frame_end = 5
-    
-    bpy.ops.mesh.primitive_ico_sphere_add(
-        subdivisions=3, radius=0.5, enter_editmode=False, location=(0, 0, 0)
+    colliders = []
+    for index in range(colliders_count):
+        angle = 2.0 * numpy.pi * index / colliders_count
+        center = (0.5 * numpy.cos(angle), 0.5 * numpy.sin(angle), 0.4)
+        colliders.append(create_box('collider_{}'.format(index), center, (0.3, 0.3, 0.8)))
+    for frame in frames:
+        emitter['frames'][frame] = {
+            'translation': emitter['center'],
+            'rotation': (1.0, 0.0, 0.0, 0.0),
+            'velocity': (0.0, 0.0, 0.0),
+            'enabled': True
+        }
+        for collider in colliders:
+            collider['frames'][frame] = {
+                'translation': collider['center'],
+                'rotation': (1.0, 0.0, 0.0, 0.0),
+                'friction': 0.5
+            }
+    return [emitter], colliders
+
+
+def get_file_size(*file_paths):
+    return sum(os.path.getsize(file_path) for file_path in file_paths if os.path.exists(file_path))
+
+
+def bench_simulation(folder, solver_type, resolution, colliders_count, frames_count):
+    stats = {}
+    frames = range(1, frames_count + 1)
+    domain = dict(DOMAIN, frames={frame: {'viscosity': 0.0} for frame in frames})
+    settings = dict(
+        SETTINGS,
+        solver_type=solver_type,
+        resolution=resolution,
+        cache_folder=folder
+    )
+    emitters, colliders = create_sources(colliders_count, frames)
+    simulation = core.Simulation(settings, domain, emitters, colliders)
+    simulation.create_emitters(frames[0])
+    simulation.create_colliders(frames[0])
+    for frame in frames:
+        with Phase(stats, 'solver_update'):
+            simulation.update_sources(frame)
+            simulation.solver.update(simulation.frame)
+        with Phase(stats, 'particle_save') as phase:
+            file_path, channels, _ = simulation.encode_particles(frame)
+            cache.write_frame(file_path, channels, origin=DOMAIN['location'])
+            phase.bytes_written = get_file_size(file_path)
+        simulation.frame.advance()
+    return stats, frames[-1]
+
+
+def bench_save(folder, particles_count):
+    # the solver returns float64 views of Vector3D arrays
+    stats = {}
+    random = numpy.random.default_rng(0)
+    positions = random.random((particles_count, 3))
+    velocities = random.random((particles_count, 3))
+    forces = random.random((particles_count, 3))
+    location = tuple(DOMAIN['location'])
+    file_path = cache.get_frame_path(folder, 'particles', 0)
+    for _ in range(SAVE_REPEATS):
+        with Phase(stats, 'particle_save') as phase:
+            cache.write_frame(
+                file_path,
+                (
+                    ('pos', cache.convert_array(positions, numpy.float32, offset=location)),
+                    ('vel', cache.convert_array(velocities, numpy.float32)),
+                    ('force', cache.convert_array(forces, numpy.float32))
+                ),
+                origin=location
+            )
+            phase.bytes_written = get_file_size(file_path)
+    return stats
+
+
+def bench_mesh(folder, resolution, converter_type, frame):
+    stats = {}
+    params = dict(
+        MESH_OPTIONS,
+        cache_folder=folder,
+        resolution=resolution,
+        resolution_mesh=resolution,
+        converter_type=converter_type
     )
-    emitter_object = bpy.context.object
+    settings = core.get_mesh_settings(DOMAIN, params)
+    grid = mesher.create_grid(settings)
+    converter = mesher.create_converter(settings)
+    with Phase(stats, 'particle_load'):
+        points = mesher.read_particles(settings, frame)
+    with Phase(stats, 'points_to_implicit'):
+        mesher.convert_points(converter, points, grid, settings['origin'], mesher.get_mesh_spacing(settings))
+    with Phase(stats, 'marching_cubes'):
+        spacing = settings['grid_spacing']
+        surface_mesh = pyjet.marchingCubes(
+            grid,
+            (spacing, spacing, spacing),
+            (0, 0, 0),
+            settings['iso_value'],
+            settings['close_flag'],
+            settings['connectivity_flag']
+        )
+    with Phase(stats, 'mesh_save') as phase:
+        mesher.save_mesh(settings, *mesher.get_mesh_arrays(surface_mesh), frame)
+        phase.bytes_written = get_file_size(
+            cache.get_frame_path(folder, 'vert', frame),
+            cache.get_frame_path(folder, 'tris', frame)
+        )
+    if bpy:
+        mesh = bpy.data.meshes.new('jet_fluids_benchmark')
+        try:
+            with Phase(stats, 'frame_import'):
+                vertices = create.load_vertices(cache.get_frame_path(folder, 'vert', frame))
+                triangles = create.load_triangles(cache.get_frame_path(folder, 'tris', frame))
+                create.set_mesh_geometry(mesh, vertices, triangles)
+        finally:
+            bpy.data.meshes.remove(mesh)
+    # whole frame with the sparse grid: convert, marching cubes and save
+    with Phase(stats, 'sparse_mesh') as phase:
+        mesher.mesh_frame(dict(settings, mesh_sparse_grid=True), converter, frame)
+        phase.bytes_written = get_file_size(
+            cache.get_frame_path(folder, 'vert', frame),
+            cache.get_frame_path(folder, 'tris', frame)
+        )
+    paths = check_mesh_paths(settings, points)
+    equivalence = None
+    if converter_type in mesher.NUMPY_CONVERTERS:
+        equivalence = bench_equivalence(settings, converter, points)
+    return stats, paths, equivalence
+
+
+def check_mesh_paths(settings, points):
+    # the sparse tiles and the cropped box must give the mesh of the whole
+    # grid, welded seams and no geometry lost at the box sides. the signed
+    # distance reinitialization is not local, so the fields are compared raw
+    settings = dict(settings, is_output_sdf=False)
+    converter = mesher.create_converter(settings)
+    tolerance = settings['grid_spacing'] * 1e-5
+    vertices, triangles = mesher.mesh_grid(settings, mesher.create_grid(settings), converter, points, {})
+    bounds = manifest.get_bounds(vertices)
+    paths = {}
+    for name, mesh in (('sparse', mesher.mesh_sparse), ('cropped', mesher.mesh_cropped)):
+        path_vertices, path_triangles = mesh(settings, converter, points, {})
+        path_bounds = manifest.get_bounds(path_vertices)
+        if bounds is None or path_bounds is None:
+            difference = 0.0 if bounds == path_bounds else float('inf')
+        else:
+            difference = float(numpy.abs(numpy.array(bounds) - numpy.array(path_bounds)).max())
+        paths[name] = {
+            'vertices': len(path_vertices),
+            'triangles': len(path_triangles),
+            'dense_vertices': len(vertices),
+            'dense_triangles': len(triangles),
+            'bounds_difference': difference,
+            'passed': (
+                len(path_vertices) == len(vertices) and
+                len(path_triangles) == len(triangles) and
+                difference <= tolerance
+            )
+        }
+    return paths
+
+
+def bench_equivalence(settings, converter, points):
+    # numpy converter against the pyjet converter at the same settings,
+    # the pyjet field is not reinitialized into the signed distance,
+    # as the numpy fields are not
+    reference_type = mesher.NUMPY_CONVERTERS[settings['converter_type']]
+    reference = mesher.create_converter(dict(settings, converter_type=reference_type, is_output_sdf=False))
+    spacing = mesher.get_mesh_spacing(settings)
+    fields = []
+    times = []
+    for field_converter in (converter, reference):
+        grid = mesher.create_grid(settings)
+        start_time = time.perf_counter()
+        mesher.convert_points(field_converter, points, grid, settings['origin'], spacing)
+        times.append(time.perf_counter() - start_time)
+        fields.append(numpy.array(grid.dataAccessor()))
+    field, reference_field = fields
+    iso_value = settings['iso_value']
+    return {
+        'reference': reference_type,
+        'time': times[0],
+        'reference_time': times[1],
+        'max_difference': float(numpy.abs(field - reference_field).max()) / spacing,
+        'sign_mismatches': int(numpy.count_nonzero((field > iso_value) != (reference_field > iso_value)))
+    }
+
+
+def check_cache(folder, positions_encoding, compression):
+    # writes moving particles and reads them back cold, returns
+    # the max position error and whether the other channels are exact
+    tolerance = SETTINGS['cache_tolerance']
+    bounds_min = numpy.array(DOMAIN['origin'])
+    bounds_max = bounds_min + DOMAIN['size']
+    random = numpy.random.default_rng(0)
+    positions = random.uniform(bounds_min, bounds_max, (CACHE_CHECK_PARTICLES, 3)).astype(numpy.float32)
+    velocities = random.normal(0.0, 0.01, positions.shape).astype(numpy.float32)
+    encoder = cache.DeltaEncoder(bounds_min, bounds_max, tolerance, CACHE_KEYFRAME_INTERVAL)
+    written = {}
+    for frame in range(1, CACHE_CHECK_FRAMES + 1):
+        positions = numpy.clip(positions + velocities, bounds_min, bounds_max).astype(numpy.float32)
+        file_path = cache.get_frame_path(folder, 'particles', frame)
+        if positions_encoding == 'QUANTIZED':
+            encoded = cache.quantize_array(positions, bounds_min, bounds_max, tolerance)
+        elif positions_encoding == 'DELTA':
+            encoded = encoder.encode(positions, file_path)
+        else:
+            encoded = positions
+        cache.write_frame(file_path, (('pos', encoded), ('vel', velocities)), compression=compression)
+        written[frame] = positions
+    max_error = 0.0
+    exact = True
+    # the last frame first, the whole delta chain is decoded without the cache
+    for frame in sorted(written, reverse=True):
+        cache.decoded.clear()
+        file_path = cache.get_frame_path(folder, 'particles', frame)
+        error = numpy.abs(cache.read_channel(file_path, 'pos') - written[frame]).max()
+        max_error = max(max_error, float(error))
+        exact &= numpy.array_equal(cache.read_channel(file_path, 'vel'), velocities)
+    cache.decoded.clear()
+    return {
+        'max_error': max_error,
+        'tolerance': tolerance,
+        'exact_channels': bool(exact),
+        'passed': bool(exact and max_error <= tolerance * (1.0 + 1e-3))
+    }
+
+
+def check(condition, message):
+    if not condition:
+        raise AssertionError(message)
+
+
+def smoke_operators(folder):
+    # bake, import and reset through the operators, as the user does
+    scene = bpy.context.scene
+    scene.frame_start, scene.frame_end = SMOKE_FRAMES
+    bpy.ops.mesh.primitive_cube_add(size=2, enter_editmode=False, location=(0, 0, 1))
+    domain = bpy.context.object
+    bpy.ops.jet_fluid.add()
+    jet = domain.jet_fluid
+    jet.object_type = 'DOMAIN'
+    jet.resolution = 20
+    jet.mesh_workers = 1
+    # without the trailing separator, the operators add it
+    jet.cache_folder = folder.rstrip(os.sep)
+    bpy.ops.mesh.primitive_ico_sphere_add(subdivisions=3, radius=0.5, enter_editmode=False, location=(0, 0, 1))
+    emitter = bpy.context.object
     bpy.ops.jet_fluid.add()
-    emitter_object.jet_fluid.object_type = 'EMITTER'
-    emitter_object.jet_fluid.particles_count = 2.0
-    
-    bpy.context.view_layer.objects.active = domain_object
+    emitter.jet_fluid.object_type = 'EMITTER'
+    emitter.jet_fluid.particles_count = 2.0
+    bpy.context.view_layer.objects.active = domain
     bpy.ops.jet_fluid.bake_particles()
     bpy.ops.jet_fluid.bake_mesh()
+    cache_manifest = manifest.get_manifest(folder)
+    for frame in range(SMOKE_FRAMES[0], SMOKE_FRAMES[1] + 1):
+        particles_record = cache_manifest.get(manifest.PARTICLES, frame)
+        mesh_record = cache_manifest.get(manifest.MESH, frame)
+        check(particles_record, 'no particles in frame {}'.format(frame))
+        check(mesh_record, 'no mesh in frame {}'.format(frame))
+        # the frame change handler imports the geometry
+        scene.frame_set(frame)
+        particles = bpy.data.objects[jet.particles_object].data
+        check(
+            len(particles.vertices) == particles_record['count'],
+            'frame {0}: {1} particles imported, {2} baked'.format(
+                frame, len(particles.vertices), particles_record['count']
+            )
+        )
+        mesh = bpy.data.objects[jet.mesh_object].data
+        check(
+            len(mesh.vertices) == mesh_record['vertices'] and len(mesh.polygons) == mesh_record['triangles'],
+            'frame {0}: mesh {1}/{2} imported, {3}/{4} baked'.format(
+                frame, len(mesh.vertices), len(mesh.polygons), mesh_record['vertices'], mesh_record['triangles']
+            )
+        )
     bpy.ops.jet_fluid.reset_particles()
     bpy.ops.jet_fluid.reset_mesh()
+    remaining = [name for name in os.listdir(folder) if name.endswith('.bin')]
+    check(not remaining, 'files left after the reset: {}'.format(', '.join(remaining)))
+    bpy.data.objects.remove(emitter)
+    bpy.data.objects.remove(domain)
+
+
+def compare(results, baseline, threshold):
+    # returns the list of regressions
+    regressions = []
+    for case_name, case in results['cases'].items():
+        base_case = baseline['cases'].get(case_name)
+        if not base_case:
+            continue
+        for phase_name, phase in case.items():
+            base_phase = base_case.get(phase_name)
+            if not base_phase or base_phase['time'] < MIN_COMPARE_TIME:
+                continue
+            ratio = phase['time'] / base_phase['time']
+            if ratio > 1.0 + threshold:
+                regressions.append((case_name, phase_name, base_phase['time'], phase['time'], ratio))
+    return regressions
+
+
+def print_results(results):
+    print('{0:<48} {1:<20} {2:>10} {3:>10} {4:>12}'.format(
+        'Case', 'Phase', 'Time', 'Peak MB', 'Written MB'
+    ))
+    for case_name, case in results['cases'].items():
+        for phase_name in PHASES:
+            phase = case.get(phase_name)
+            if not phase:
+                continue
+            print('{0:<48} {1:<20} {2:>10.3f} {3:>10.1f} {4:>12.2f}'.format(
+                case_name,
+                phase_name,
+                phase['time'],
+                phase['peak_memory'] / 2 ** 20,
+                phase['bytes_written'] / 2 ** 20
+            ))
+
+
+def print_equivalence(results):
+    print('{0:<48} {1:>10} {2:>10} {3:>14} {4:>10}'.format(
+        'Case', 'Time', 'Pyjet', 'Max Difference', 'Mismatches'
+    ))
+    for case_name, equivalence in results['equivalence'].items():
+        print('{0:<48} {1:>10.3f} {2:>10.3f} {3:>14.2e} {4:>10}'.format(
+            case_name,
+            equivalence['time'],
+            equivalence['reference_time'],
+            equivalence['max_difference'],
+            equivalence['sign_mismatches']
+        ))
+
+
+def parse_args():
+    # blender arguments end with "--"
+    argv = sys.argv[sys.argv.index('--') + 1 : ] if '--' in sys.argv else []
+    parser = argparse.ArgumentParser(prog='tests.py')
+    parser.add_argument('--solvers', nargs='+', default=SOLVERS, choices=SOLVERS)
+    parser.add_argument('--resolutions', nargs='+', type=int, default=RESOLUTIONS)
+    parser.add_argument('--converters', nargs='+', default=CONVERTERS, choices=CONVERTERS)
+    parser.add_argument('--colliders', nargs='+', type=int, default=COLLIDERS)
+    parser.add_argument('--frames', type=int, default=3)
+    parser.add_argument('--save-particles', nargs='*', type=int, default=SAVE_PARTICLES, help='particles counts of the save cases')
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--baseline', help='results of a previous run')
+    parser.add_argument('--threshold', type=float, default=0.2, help='allowed slowdown, 0.2 - 20 percent')
+    return parser.parse_args(argv)
+
+
+def main():
+    args = parse_args()
+    pyjet.Logging.mute()
+    core.print_info = lambda *params: None
+    mesher.print_mesh_info = lambda *params: None
+    results = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+            'platform': platform.platform(),
+            'python': platform.python_version(),
+            'blender': bpy.app.version_string if bpy else None,
+            'frames': args.frames
+        },
+        'cases': {},
+        'equivalence': {},
+        'cache': {},
+        'mesh_paths': {},
+        'smoke': None
+    }
+    # cache paths are the folder joined with the file name
+    folder = tempfile.mkdtemp(prefix='jet_fluids_benchmark_') + os.sep
+    try:
+        for positions_encoding, compression in CACHE_ENCODINGS:
+            check_name = '{0}_{1}'.format(positions_encoding, compression).lower()
+            print('Cache check: {}'.format(check_name))
+            check_folder = tempfile.mkdtemp(prefix=check_name + '_', dir=folder) + os.sep
+            results['cache'][check_name] = check_cache(check_folder, positions_encoding, compression)
+        if bpy:
+            print('Smoke: operators')
+            smoke_folder = os.path.join(folder, 'operators', '')
+            os.makedirs(smoke_folder)
+            try:
+                smoke_operators(smoke_folder)
+            except Exception as error:
+                results['smoke'] = {'passed': False, 'error': '{0}: {1}'.format(type(error).__name__, error)}
+            else:
+                results['smoke'] = {'passed': True, 'error': None}
+        for particles_count in args.save_particles:
+            case_name = 'save_{}'.format(particles_count)
+            print('Benchmark: {}'.format(case_name))
+            results['cases'][case_name] = bench_save(folder, particles_count)
+        for solver_type in args.solvers:
+            for resolution in args.resolutions:
+                for colliders_count in args.colliders:
+                    case_name = '{0}_res{1}_col{2}'.format(solver_type, resolution, colliders_count)
+                    print('Benchmark: {}'.format(case_name))
+                    stats, last_frame = bench_simulation(
+                        folder,
+                        solver_type,
+                        resolution,
+                        colliders_count,
+                        args.frames
+                    )
+                    results['cases'][case_name] = stats
+                    for converter_type in args.converters:
+                        mesh_case_name = '{0}_{1}'.format(case_name, converter_type.lower())
+                        print('Benchmark: {}'.format(mesh_case_name))
+                        stats, paths, equivalence = bench_mesh(
+                            folder,
+                            resolution,
+                            converter_type,
+                            last_frame
+                        )
+                        results['cases'][mesh_case_name] = stats
+                        results['mesh_paths'][mesh_case_name] = paths
+                        if equivalence:
+                            results['equivalence'][mesh_case_name] = equivalence
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    with open(args.output, 'w') as file:
+        json.dump(results, file, indent=4)
+
+    print('\n' * 5)
+    print('=' * 79)
+    print_results(results)
+    print('=' * 79)
+    code = 0
+    if results['equivalence']:
+        print_equivalence(results)
+        print('=' * 79)
+    for check_name, cache_check in results['cache'].items():
+        if not cache_check['passed']:
+            print('CACHE ROUND TRIP FAILED: {0}: error {1:.2e}, tolerance {2:.2e}, exact channels {3}'.format(
+                check_name, cache_check['max_error'], cache_check['tolerance'], cache_check['exact_channels']
+            ))
+            code = 1
+    for case_name, paths in results['mesh_paths'].items():
+        for path_name, path in paths.items():
+            if not path['passed']:
+                print('MESH MISMATCH: {0} {1}: {2}/{3} vertices/triangles, dense {4}/{5}, bounds {6:.2e}'.format(
+                    case_name,
+                    path_name,
+                    path['vertices'],
+                    path['triangles'],
+                    path['dense_vertices'],
+                    path['dense_triangles'],
+                    path['bounds_difference']
+                ))
+                code = 1
+    if results['smoke'] and not results['smoke']['passed']:
+        print('OPERATORS SMOKE RUN FAILED: {}'.format(results['smoke']['error']))
+        code = 1
+    for case_name, equivalence in results['equivalence'].items():
+        if equivalence['max_difference'] > EQUIVALENCE_TOLERANCE:
+            print('NOT EQUIVALENT: {0}: {1:.2e} cells from {2}'.format(
+                case_name, equivalence['max_difference'], equivalence['reference']
+            ))
+            code = 1
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        for case_name, phase_name, base_time, new_time, ratio in regressions:
+            print('REGRESSION: {0} {1}: {2:.3f} -> {3:.3f} sec ({4:.0%})'.format(
+                case_name, phase_name, base_time, new_time, ratio - 1.0
+            ))
+        if regressions:
+            code = 1
+    print('FINISH!')
+    print('=' * 79)
+    sys.exit(code)
 
-os.removedirs(cache_folder)
 
-print('\n' * 5)
-print('=' * 79)
-print('FINISH!')
-print('=' * 79)
+main()